@@ -199,18 +199,29 @@ const YourInteractions = () => {
         }
     };
 
-    const fetchSuggestions = async () => {
-        try {
-            setSuggestionsLoading(true);
-            const response = await fetch('http://127.0.0.1:5010/api/user-suggestions/U024');
-            const data = await response.json();
-            console.log(data);
-            setSuggestions(data);
-        } catch (err) {
-            console.error('Error fetching suggestions:', err);
-        } finally {
+    const fetchSuggestions = () => {
+        setSuggestionsLoading(true);
+        // Patterns arrive first, then the suggestion text streams in chunk by chunk
+        const source = new EventSource('http://127.0.0.1:5010/api/user-suggestions/U024/stream');
+
+        source.addEventListener('patterns', (event) => {
+            const data = JSON.parse(event.data);
+            setSuggestions({ user_patterns: data.user_patterns, suggestions: '' });
+        });
+        source.addEventListener('suggestion', (event) => {
+            const { text } = JSON.parse(event.data);
+            setSuggestions(prev => ({ ...prev, suggestions: (prev?.suggestions || '') + text }));
             setSuggestionsLoading(false);
-        }
+        });
+        source.addEventListener('done', () => {
+            source.close();
+            setSuggestionsLoading(false);
+        });
+        source.addEventListener('error', (event) => {
+            console.error('Error fetching suggestions:', event.data || event);
+            source.close();
+            setSuggestionsLoading(false);
+        });
     };
 
     const calculateStats = (data) => {
@@ -0,0 +1,241 @@
+"""Synthetic-scale benchmarks for the rl_agent suggestion path.
+
+Builds single-user histories of increasing size with ``generate_data`` and
+times every ranker stage, the user pattern computation and the full
+``/api/user-suggestions`` endpoint. MongoDB is replaced by a local stand-in
+(mongomock by default, or a throwaway database on a local mongod) and Gemini
+by a stub that answers instantly, so only our own code is measured.
+
+Usage:
+    python benchmark.py                              # 100, 10k, 100k, 1M actions
+    python benchmark.py --sizes 100,10000 --repeat 5 --output bench.json
+    python benchmark.py --backend mongodb --mongo-uri mongodb://localhost:27017
+    python benchmark.py --compare previous.json      # print speedups vs an earlier run
+"""
+import argparse
+import json
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import model as rl
+from data import generate_data
+
+BENCH_USER = 'BENCH_USER'
+BENCH_DATABASE = 'rl_agent_benchmark'
+
+class StubGemini:
+    """Stands in for the Gemini model so the endpoint never leaves the process."""
+
+    class _Response:
+        text = "1. Review pending tasks\n2. Schedule a follow-up meeting\n3. Send a status summary"
+
+    def generate_content(self, prompt, stream=False):
+        return iter([self._Response()]) if stream else self._Response()
+
+def connect_backend(backend, mongo_uri):
+    """Return a database on the chosen Mongo stand-in."""
+    if backend == 'mongomock':
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("[Bench] mongomock is not installed: pip install mongomock, "
+                             "or run against a local mongod with --backend mongodb")
+        return mongomock.MongoClient()[BENCH_DATABASE]
+    from pymongo import MongoClient
+    return MongoClient(mongo_uri)[BENCH_DATABASE]
+
+def install_stand_ins(database):
+    """Point the service's collections and Gemini client at the stand-ins."""
+    rl.user_actions_collection = database['user_data']
+    rl.user_aggregates_collection = database['user_aggregates']
+    rl.suggestion_cache_collection = database['suggestion_cache']
+    rl.user_suggestions_collection = database['user_suggestions']
+    rl.agent_bandit_collection = database['agent_bandit_state']
+    rl.task_transitions_collection = database['task_transitions']
+    rl.user_data_daily_collection = database['user_data_daily']
+    rl.model = StubGemini()
+    rl.suggestion_cache = rl.SuggestionCache(rl.SUGGESTION_CACHE_SIZE, rl.SUGGESTION_CACHE_TTL)
+    rl.ranker_models = rl.RankerModelRegistry(tempfile.mkdtemp(prefix='rl_bench_models_'))
+    rl.task_transitions = rl.TaskTransitionModel(
+        rl.task_transitions_collection, rl.SuggestionCache(rl.TRANSITION_CACHE_SIZE, rl.TRANSITION_CACHE_TTL))
+
+# Reward credited per completion status before feedback is blended in
+STATUS_REWARD = {'Completed': 1.0, 'In Progress': 0.5, 'Failed': 0.0}
+
+def synthesize_rewards(frame):
+    """Reward in [0, 1] from completion status and feedback.
+
+    ``generate_data`` has no reward column, and a constant default would
+    leave K-Means unfitted and the other rankers scoring a constant.
+    """
+    status = frame['completion_status'].astype(str).map(STATUS_REWARD).fillna(0.0).to_numpy()
+    feedback = frame['feedback_score'].to_numpy(dtype=float) / 5.0
+    return np.round(0.6 * status + 0.4 * feedback, 3)
+
+def build_history(size, seed):
+    """Generate ``size`` synthetic actions, all belonging to the bench user."""
+    frame = generate_data(size, seed=seed)
+    frame['user_id'] = BENCH_USER
+    frame['reward'] = synthesize_rewards(frame)
+    records = frame.to_dict('records')
+    for record in records:
+        record['timestamp'] = record['timestamp'].to_pydatetime()
+    return records
+
+def load_history(database, records):
+    """Replace the stand-in's contents with ``records``."""
+    for name in ('user_data', 'user_aggregates', 'user_suggestions', 'agent_bandit_state', 'task_transitions',
+                 'user_data_daily'):
+        database[name].delete_many({})
+    for start in range(0, len(records), 50000):
+        database['user_data'].insert_many([dict(record) for record in records[start:start + 50000]], ordered=False)
+    rl.ensure_indexes()
+
+def timed(func, repeat):
+    """Run ``func`` ``repeat`` times; return its last result and timing stats in ms."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, {
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'max_ms': round(max(samples), 3)
+    }
+
+def bench_rankers(records, repeat, mc_samples):
+    """Time building the columns and every ranker stage over the full history."""
+    actions = sorted(records, key=lambda record: record['timestamp'], reverse=True)
+    columns, columns_timing = timed(lambda: rl.ActionColumns(actions), repeat)
+    aggregates = rl.rebuild_user_aggregates(BENCH_USER) or {}
+    context = {'rng': rl.make_rng(), 'aggregates': aggregates, 'posteriors': {}, 'mc_samples': mc_samples}
+
+    try:
+        rl.ranker_models.train(sample_size=min(len(records), rl.RANKER_TRAINING_SAMPLE))
+    except Exception as e:
+        print(f"[Bench] Ranker model training unavailable on this backend: {str(e)}")
+
+    stages = {}
+    for name in rl.RANKER_STAGES:
+        _, stages[name] = timed(lambda: rl.run_ranker_pipeline(columns, context, (name,)), repeat)
+    return {'columns': columns_timing, 'stages': stages}
+
+def bench_patterns(repeat):
+    """Time the aggregate backfill and both ways of building a pattern profile."""
+    _, rebuild = timed(lambda: rl.rebuild_user_aggregates(BENCH_USER), repeat)
+    _, from_aggregates = timed(lambda: rl.UserPatternProfile.for_user(BENCH_USER), repeat)
+    try:
+        _, from_collection = timed(lambda: rl.UserPatternProfile.from_collection(BENCH_USER), repeat)
+    except Exception as e:
+        from_collection = {'error': str(e)}
+    return {
+        'rebuild_aggregates': rebuild,
+        'profile_from_aggregates': from_aggregates,
+        'profile_from_collection': from_collection
+    }
+
+def bench_endpoint(repeat, mc_samples):
+    """Time the full GET endpoint, cold (cache invalidated) and warm."""
+    client = rl.app.test_client()
+    url = f'/api/user-suggestions/{BENCH_USER}?mc_samples={mc_samples}'
+
+    def cold():
+        rl.suggestion_cache.invalidate(BENCH_USER)
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(response.get_json())
+        return response
+
+    response, cold_timing = timed(cold, repeat)
+    _, warm_timing = timed(lambda: client.get(url), repeat)
+    _, fast_timing = timed(lambda: client.get(f'{url}&mode=fast'), repeat)
+    return {
+        'cold': cold_timing,
+        'warm': warm_timing,
+        'fast': fast_timing,
+        'actions_analyzed': response.get_json()['recent_actions_analyzed'],
+        'server_timing': response.headers.get('Server-Timing')
+    }
+
+def compare(results, baseline_path):
+    """Print median speedups of this run relative to an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = {run['size']: run for run in json.load(f)['runs']}
+
+    def medians(run, prefix=''):
+        for key, value in run.items():
+            if isinstance(value, dict) and 'median_ms' in value:
+                yield prefix + key, value['median_ms']
+            elif isinstance(value, dict):
+                yield from medians(value, f'{prefix}{key}.')
+
+    for run in results['runs']:
+        previous = baseline.get(run['size'])
+        if previous is None:
+            continue
+        before = dict(medians(previous))
+        print(f"\nSize {run['size']}:")
+        for name, median in medians(run):
+            if name in before and median > 0:
+                print(f"  {name:45s} {before[name]:10.3f} ms -> {median:10.3f} ms  ({before[name] / median:5.2f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rl_agent rankers and suggestion endpoint.")
+    parser.add_argument('--sizes', default='100,10000,100000,1000000',
+                        help="Comma-separated history sizes (number of actions)")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed repetitions per measurement")
+    parser.add_argument('--mc-samples', type=int, default=rl.MONTE_CARLO_SAMPLES,
+                        help="Monte Carlo sample budget used by the rankers")
+    parser.add_argument('--backend', choices=['mongomock', 'mongodb'], default='mongomock',
+                        help="Mongo stand-in: in-process mongomock or a local mongod")
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017',
+                        help="Local mongod used with --backend mongodb (database is wiped)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-endpoint', action='store_true', help="Only time rankers and patterns")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the JSON results")
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    database = connect_backend(args.backend, args.mongo_uri)
+    install_stand_ins(database)
+
+    results = {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'backend': args.backend,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'mc_samples': args.mc_samples,
+        'repeat': args.repeat,
+        'runs': []
+    }
+    for size in (int(size) for size in args.sizes.split(',')):
+        print(f"[Bench] Generating {size} actions...")
+        records = build_history(size, args.seed)
+        load_history(database, records)
+
+        run = {'size': size}
+        print(f"[Bench] Timing rankers on {size} actions...")
+        run['rankers'] = bench_rankers(records, args.repeat, args.mc_samples)
+        print(f"[Bench] Timing user patterns on {size} actions...")
+        run['patterns'] = bench_patterns(args.repeat)
+        if not args.skip_endpoint:
+            print(f"[Bench] Timing the suggestion endpoint on {size} actions...")
+            run['endpoint'] = bench_endpoint(args.repeat, args.mc_samples)
+        results['runs'].append(run)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"[Bench] Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
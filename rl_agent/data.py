@@ -1,237 +1,703 @@
-import random
+import json
+import os
+import time
 import pandas as pd
 import numpy as np
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-from sklearn.metrics import accuracy_score, classification_report
-from xgboost import XGBClassifier
-from sklearn.model_selection import GridSearchCV
-from imblearn.over_sampling import SMOTE
-
-def generate_data(num_records=1000):
-    # Define more realistic relationships between features
-    agents = ["Executive Assistant", "Task Management", "Calendar Agent"]
-    task_types = {
-        "Executive Assistant": ["Schedule Meeting", "Send Email", "Generate Summary"],
-        "Task Management": ["Assign Task", "Track Progress", "Send Reminder"],
-        "Calendar Agent": ["Update Event", "Resolve Conflict", "Send Confirmation"]
+
+from features import FeatureTransformer, INPUT_COLUMNS
+
+# sklearn, xgboost and imblearn are imported inside the functions that use
+# them, so importing this module (e.g. for predict_tasks) stays cheap.
+
+DEFAULT_MODEL_PATH = 'task_prediction_model.joblib'
+DEFAULT_TRANSFORMER_PATH = 'feature_transformer.joblib'
+DEFAULT_ENCODERS_PATH = 'feature_encoders.joblib'
+DEFAULT_CHECKPOINT_PATH = 'training_checkpoint.json'
+CHECKPOINT_OVERLAP_SECONDS = 60  # Re-read window for ObjectIds from other clients
+
+AGENTS = ["Executive Assistant", "Task Management", "Calendar Agent"]
+TASK_TYPES = {
+    "Executive Assistant": ["Schedule Meeting", "Send Email", "Generate Summary"],
+    "Task Management": ["Assign Task", "Track Progress", "Send Reminder"],
+    "Calendar Agent": ["Update Event", "Resolve Conflict", "Send Confirmation"]
+}
+LANGUAGES = ["English", "Spanish", "French", "German", "Chinese"]
+PRIORITIES = ["Low", "Medium", "High"]
+STATUSES = ["Completed", "In Progress", "Failed"]
+DATA_COLUMNS = [
+    "user_id", "session_id", "timestamp", "hour_of_day", "day_of_week",
+    "agent_used", "task_type", "interaction_duration", "completion_status",
+    "priority_level", "response_time", "feedback_score", "language",
+    "sentiment_score", "follow_up_required"
+]
+
+# Flat task table: agent index * 3 + choice gives the task index
+TASK_NAMES = [task for agent in AGENTS for task in TASK_TYPES[agent]]
+LONG_TASKS = np.array(["Meeting" in task or "Summary" in task for task in TASK_NAMES])
+# Higher weights during work hours
+HOUR_WEIGHTS = np.array([1]*6 + [4]*8 + [3]*4 + [2]*6, dtype=float)
+HOUR_WEIGHTS /= HOUR_WEIGHTS.sum()
+FEEDBACK_FLOOR = np.array([4.0, 3.5, 3.0])  # per status, each range is one point wide
+START_TIME = np.datetime64('2025-02-01T08:00')
+
+def generate_user_preferences(rng, num_users=50):
+    """Consistent per-user behaviour: preferred agent, language and priority indices."""
+    return {
+        'preferred_agent': rng.integers(0, len(AGENTS), num_users),
+        'preferred_language': rng.integers(0, len(LANGUAGES), num_users),
+        'typical_priority': rng.integers(0, len(PRIORITIES), num_users)
     }
-    
-    data = []
-    start_time = datetime(2025, 2, 1, 8, 0, 0)
-    
-    # Create consistent user behaviors
-    user_preferences = {}
-    for i in range(1, 51):
-        user_id = f"U{i:03d}"
-        user_preferences[user_id] = {
-            'preferred_agent': random.choice(agents),
-            'preferred_language': random.choice(["English", "Spanish", "French", "German", "Chinese"]),
-            'typical_priority': random.choice(["Low", "Medium", "High"])
-        }
-    
-    for i in range(num_records):
-        user_id = f"U{random.randint(1, 50):03d}"
-        preferences = user_preferences[user_id]
-        
-        # Make agent selection biased towards user preference
-        if random.random() < 0.8:  # 80% chance to use preferred agent
-            agent = preferences['preferred_agent']
-        else:
-            agent = random.choice(agents)
-            
-        # Select task based on agent
-        task = random.choice(task_types[agent])
-        
-        # Generate timestamp with realistic patterns
-        hour = random.choices(
-            range(24),
-            weights=[1]*6 + [4]*8 + [3]*4 + [2]*6,  # Higher weights during work hours
-            k=1
-        )[0]
-        
-        timestamp = start_time + timedelta(
-            days=random.randint(0, 30),
-            hours=hour,
-            minutes=random.randint(0, 59)
-        )
-        
-        # Create correlations between features
-        priority = preferences['typical_priority']
-        if priority == "High":
-            response_time = random.randint(1, 5)  # Faster response for high priority
-        else:
-            response_time = random.randint(3, 10)
-            
-        # Duration based on task type
-        if "Meeting" in task or "Summary" in task:
-            duration = random.randint(300, 600)
-        else:
-            duration = random.randint(60, 300)
-            
-        # Status influenced by duration and priority
-        if duration > 400 and priority == "High":
-            status_weights = [0.7, 0.2, 0.1]  # More likely to be completed
-        else:
-            status_weights = [0.6, 0.3, 0.1]
-        status = random.choices(
-            ["Completed", "In Progress", "Failed"],
-            weights=status_weights,
-            k=1
-        )[0]
-        
-        # Feedback correlated with status
-        if status == "Completed":
-            feedback = round(random.uniform(4.0, 5.0), 1)
-        elif status == "In Progress":
-            feedback = round(random.uniform(3.5, 4.5), 1)
-        else:
-            feedback = round(random.uniform(3.0, 4.0), 1)
-        
-        data.append([
-            user_id,
-            f"S{100 + i}",
-            timestamp,
-            hour,
-            timestamp.weekday(),
-            agent,
-            task,
-            duration,
-            status,
-            priority,
-            response_time,
-            feedback,
-            preferences['preferred_language'],
-            round(random.uniform(-1.0, 1.0), 2),
-            "Yes" if priority == "High" else random.choice(["Yes", "No"])
-        ])
-    
-    return pd.DataFrame(data, columns=[
-        "user_id", "session_id", "timestamp", "hour_of_day", "day_of_week",
-        "agent_used", "task_type", "interaction_duration", "completion_status",
-        "priority_level", "response_time", "feedback_score", "language",
-        "sentiment_score", "follow_up_required"
-    ])
+
+def generate_data(num_records=1000, seed=None, num_users=50, preferences=None, start_index=0, rng=None):
+    """Generate synthetic interactions, one NumPy draw per column.
+
+    Keeps the original correlations: users stick to a preferred agent 80% of
+    the time and to their language and priority, high priority means faster
+    responses, meetings and summaries take longer, long high-priority work
+    completes more often and feedback follows completion status. Pass the
+    same ``preferences`` and ``rng`` with increasing ``start_index`` to build
+    one consistent dataset in chunks.
+    """
+    rng = rng if rng is not None else np.random.default_rng(seed)
+    if preferences is None:
+        preferences = generate_user_preferences(rng, num_users)
+    num_users = len(preferences['preferred_agent'])
+    n = num_records
+
+    users = rng.integers(0, num_users, n)
+
+    # Make agent selection biased towards user preference
+    agent = np.where(rng.random(n) < 0.8, preferences['preferred_agent'][users], rng.integers(0, len(AGENTS), n))
+    task = agent * 3 + rng.integers(0, 3, n)
+
+    hour = rng.choice(24, size=n, p=HOUR_WEIGHTS)
+    timestamp = (
+        START_TIME
+        + rng.integers(0, 31, n).astype('timedelta64[D]')
+        + hour.astype('timedelta64[h]')
+        + rng.integers(0, 60, n).astype('timedelta64[m]')
+    )
+    timestamp = pd.to_datetime(timestamp)
+
+    # Faster response for high priority
+    priority = preferences['typical_priority'][users]
+    high = priority == PRIORITIES.index("High")
+    response_time = np.where(high, rng.integers(1, 6, n), rng.integers(3, 11, n))
+
+    # Duration based on task type
+    duration = np.where(LONG_TASKS[task], rng.integers(300, 601, n), rng.integers(60, 301, n))
+
+    # Status influenced by duration and priority
+    likely_complete = (duration > 400) & high
+    completed = np.where(likely_complete, 0.7, 0.6)
+    in_progress = np.where(likely_complete, 0.2, 0.3)
+    draw = rng.random(n)
+    status = (draw >= completed).astype(np.int64) + (draw >= completed + in_progress)
+
+    # Feedback correlated with status
+    feedback = np.round(FEEDBACK_FLOOR[status] + rng.random(n), 1)
+    sentiment = np.round(rng.uniform(-1.0, 1.0, n), 2)
+    follow_up = np.where(high | (rng.random(n) < 0.5), "Yes", "No")
+
+    user_labels = np.array([f"U{i:03d}" for i in range(1, num_users + 1)])
+    return pd.DataFrame({
+        "user_id": pd.Categorical.from_codes(users, user_labels),
+        "session_id": "S" + pd.Series(np.arange(start_index, start_index + n) + 100).astype(str),
+        "timestamp": timestamp,
+        "hour_of_day": hour,
+        "day_of_week": timestamp.weekday,
+        "agent_used": pd.Categorical.from_codes(agent, AGENTS),
+        "task_type": pd.Categorical.from_codes(task, TASK_NAMES),
+        "interaction_duration": duration,
+        "completion_status": pd.Categorical.from_codes(status, STATUSES),
+        "priority_level": pd.Categorical.from_codes(priority, PRIORITIES),
+        "response_time": response_time,
+        "feedback_score": feedback,
+        "language": pd.Categorical.from_codes(preferences['preferred_language'][users], LANGUAGES),
+        "sentiment_score": sentiment,
+        "follow_up_required": follow_up
+    }, columns=DATA_COLUMNS)
+
+def write_data(path, num_records, chunk_size=500000, seed=None, num_users=50):
+    """Generate ``num_records`` interactions in chunks straight to CSV or Parquet.
+
+    The format follows the file extension; Parquet needs pyarrow. Memory use
+    is bounded by ``chunk_size`` whatever the total size.
+    """
+    rng = np.random.default_rng(seed)
+    preferences = generate_user_preferences(rng, num_users)
+    parquet = path.endswith('.parquet')
+    if parquet:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing Parquet requires pyarrow (pip install pyarrow)")
+
+    writer = None
+    try:
+        for start in range(0, num_records, chunk_size):
+            chunk = generate_data(min(chunk_size, num_records - start), preferences=preferences,
+                                  start_index=start, rng=rng)
+            if parquet:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+            print(f"Wrote {start + len(chunk)}/{num_records} interactions")
+    finally:
+        if writer is not None:
+            writer.close()
 
 def prepare_features(data, target="task_type"):
-    # Create feature engineering pipeline
-    df = data.copy()
-    
-    # Add time-based features
-    df['is_weekend'] = df['day_of_week'].apply(lambda x: 1 if x >= 5 else 0)
-    df['is_work_hours'] = df['hour_of_day'].apply(lambda x: 1 if 9 <= x <= 17 else 0)
-    
-    # Create interaction features
-    df['efficiency_score'] = df['interaction_duration'] / df['response_time']
-    
-    # Encode categorical features
-    label_encoders = {}
-    categorical_features = [
-        "agent_used", "completion_status", "priority_level",
-        "language", "follow_up_required"
-    ]
-    
-    # First encode the target variable
-    target_encoder = LabelEncoder()
-    y = target_encoder.fit_transform(df[target])
-    label_encoders['target'] = target_encoder
-    
-    # Then encode other categorical features
-    for column in categorical_features:
-        le = LabelEncoder()
-        df[column] = le.fit_transform(df[column])
-        label_encoders[column] = le
-    
-    # Scale numerical features
-    scaler = StandardScaler()
-    numerical_features = [
-        'hour_of_day', 'day_of_week', 'interaction_duration',
-        'response_time', 'feedback_score', 'sentiment_score',
-        'efficiency_score'
-    ]
-    df[numerical_features] = scaler.fit_transform(df[numerical_features])
-    
-    # Define features to use
-    feature_columns = (
-        categorical_features + numerical_features +
-        ['is_weekend', 'is_work_hours']
+    # Fit the feature pipeline once; the fitted transformer is saved with the
+    # model so serving builds exactly the same features without refitting
+    transformer = FeatureTransformer(target=target)
+    X = transformer.fit_transform(data)
+    y = transformer.encode_target(data[target])
+    return X, y, transformer
+
+# Search space for the budgeted search; n_estimators is the resource that
+# successive halving grows, with early stopping on the validation split
+PARAM_SPACE = {
+    'max_depth': [3, 6, 9, 12],
+    'learning_rate': [0.01, 0.05, 0.1],
+    'min_child_weight': [1, 3, 5],
+    'subsample': [0.8, 0.9, 1.0]
+}
+MAX_ESTIMATORS = 300
+EARLY_STOPPING_ROUNDS = 20
+TRAIN_BUDGET_SECONDS = 300
+BEST_PARAMS_PATH = 'best_params.json'
+
+def load_best_params(path=BEST_PARAMS_PATH):
+    """Best parameters from the previous training run, or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_best_params(params, path=BEST_PARAMS_PATH):
+    with open(path, 'w') as f:
+        json.dump(params, f, indent=2)
+
+def thread_allocation(n_candidates, search_workers=None):
+    """Split the cores between concurrent fits and each booster's own threads.
+
+    Returns ``(search_workers, booster_threads)`` whose product never exceeds
+    the core count, so the search does not oversubscribe the machine.
+    """
+    cores = os.cpu_count() or 1
+    workers = search_workers or max(1, cores // 4)
+    workers = max(1, min(workers, n_candidates, cores))
+    return workers, max(1, cores // workers)
+
+def sample_candidates(n_candidates, rng, warm_start=None):
+    """Distinct random configurations from PARAM_SPACE, warm start first."""
+    candidates = []
+    if warm_start:
+        candidates.append({name: warm_start[name] for name in PARAM_SPACE if name in warm_start})
+    total = int(np.prod([len(values) for values in PARAM_SPACE.values()]))
+    while len(candidates) < min(n_candidates, total):
+        params = {name: values[rng.integers(len(values))] for name, values in PARAM_SPACE.items()}
+        params = {name: value.item() if hasattr(value, 'item') else value for name, value in params.items()}
+        if params not in candidates:
+            candidates.append(params)
+    return candidates
+
+def fit_candidate(params, n_estimators, fit_data, val_data, n_jobs, random_state=42):
+    """Fit one configuration with early stopping; returns (val_accuracy, model)."""
+    from sklearn.metrics import accuracy_score
+    from xgboost import XGBClassifier
+
+    X_fit, y_fit = fit_data
+    X_val, y_val = val_data
+    model = XGBClassifier(
+        **params,
+        n_estimators=n_estimators,
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        n_jobs=n_jobs,
+        random_state=random_state
     )
-    
-    return df[feature_columns], y, label_encoders
+    model.fit(X_fit, y_fit, eval_set=[(X_val, y_val)], verbose=False)
+    return accuracy_score(y_val, model.predict(X_val)), model
+
+def successive_halving_search(fit_data, val_data, n_candidates=27, eta=3, min_estimators=25,
+                              max_estimators=MAX_ESTIMATORS, budget_seconds=TRAIN_BUDGET_SECONDS,
+                              warm_start=None, search_workers=None, random_state=42):
+    """Successive halving over random configurations within a wall-clock budget.
+
+    Every rung fits the surviving candidates with ``eta`` times more boosting
+    rounds than the last and keeps the best ``1/eta`` of them. Fits that
+    would start after the budget is spent are skipped, and the best model
+    seen so far is returned as ``(model, params, val_accuracy)``.
+    """
+    deadline = time.monotonic() + budget_seconds
+    rng = np.random.default_rng(random_state)
+    candidates = sample_candidates(n_candidates, rng, warm_start)
+    workers, booster_threads = thread_allocation(len(candidates), search_workers)
+    print(f"Searching {len(candidates)} candidates with {workers} workers x {booster_threads} booster threads")
+
+    def run(params, n_estimators):
+        if time.monotonic() >= deadline:
+            return None
+        return fit_candidate(params, n_estimators, fit_data, val_data, booster_threads, random_state)
+
+    best = (-1.0, None, None)
+    n_estimators = min_estimators
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while candidates:
+            results = list(executor.map(lambda params: run(params, n_estimators), candidates))
+            scored = sorted(
+                ((result[0], index, result[1]) for index, result in enumerate(results) if result is not None),
+                key=lambda item: item[0], reverse=True
+            )
+            if not scored:
+                break
+            score, index, model = scored[0]
+            # Ties go to the later rung, whose model saw more boosting rounds
+            if score >= best[0]:
+                best = (score, model, candidates[index])
+            print(f"Rung with {n_estimators} rounds: {len(scored)} fitted, best validation accuracy {score:.3f}")
+
+            if time.monotonic() >= deadline:
+                print("Training budget exhausted, keeping the best model so far")
+                break
+            if n_estimators >= max_estimators or len(scored) == 1:
+                break
+            keep = max(1, len(scored) // eta)
+            candidates = [candidates[index] for _, index, _ in scored[:keep]]
+            n_estimators = min(max_estimators, n_estimators * eta)
+
+    score, model, params = best
+    if model is None:
+        raise RuntimeError("Training budget too small to fit a single candidate")
+    params = dict(params, n_estimators=int(model.best_iteration) + 1)
+    return model, params, score
+
+def train_model(X, y, search='halving', budget_seconds=TRAIN_BUDGET_SECONDS,
+                warm_start=None, search_workers=None, random_state=42):
+    from imblearn.over_sampling import SMOTE
+    from sklearn.metrics import accuracy_score, classification_report
+    from sklearn.model_selection import GridSearchCV, train_test_split
+    from xgboost import XGBClassifier
 
-def train_model(X, y):
     # Handle class imbalance
-    smote = SMOTE(random_state=42)
+    smote = SMOTE(random_state=random_state)
     X_resampled, y_resampled = smote.fit_resample(X, y)
     
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(
-        X_resampled, y_resampled, test_size=0.2, random_state=42
+        X_resampled, y_resampled, test_size=0.2, random_state=random_state
     )
     
-    # Define broader hyperparameter search
-    param_grid = {
-        'n_estimators': [100, 200, 300],
-        'max_depth': [3, 6, 9, 12],
-        'learning_rate': [0.01, 0.05, 0.1],
-        'min_child_weight': [1, 3, 5],
-        'subsample': [0.8, 0.9, 1.0]
-    }
-    
-    # Perform grid search with cross-validation
-    model = XGBClassifier(random_state=42)
-    grid_search = GridSearchCV(
-        estimator=model,
-        param_grid=param_grid,
-        cv=5,
-        scoring='accuracy',
-        n_jobs=-1
-    )
-    grid_search.fit(X_train, y_train)
+    if search == 'grid':
+        # Exhaustive grid search with cross-validation (slow, kept for comparison)
+        param_grid = dict(PARAM_SPACE, n_estimators=[100, 200, 300])
+        workers, booster_threads = thread_allocation(
+            int(np.prod([len(values) for values in param_grid.values()])) * 5, search_workers)
+        grid_search = GridSearchCV(
+            estimator=XGBClassifier(random_state=random_state, n_jobs=booster_threads),
+            param_grid=param_grid,
+            cv=5,
+            scoring='accuracy',
+            n_jobs=workers
+        )
+        grid_search.fit(X_train, y_train)
+        best_model, best_params = grid_search.best_estimator_, grid_search.best_params_
+    else:
+        # Hold out a validation split for early stopping and candidate ranking
+        X_fit, X_val, y_fit, y_val = train_test_split(
+            X_train, y_train, test_size=0.2, random_state=random_state
+        )
+        best_model, best_params, _ = successive_halving_search(
+            (X_fit, y_fit), (X_val, y_val),
+            budget_seconds=budget_seconds,
+            warm_start=warm_start,
+            search_workers=search_workers,
+            random_state=random_state
+        )
     
     # Evaluate model
-    best_model = grid_search.best_estimator_
     y_pred = best_model.predict(X_test)
     
     print("Model Performance:")
-    print(f"Best parameters: {grid_search.best_params_}")
+    print(f"Best parameters: {best_params}")
     print(f"Accuracy: {accuracy_score(y_test, y_pred):.3f}")
     print("\nDetailed Classification Report:")
     print(classification_report(y_test, y_pred))
     
-    return best_model, (X_test, y_test)
-
-# Generate and prepare data
-print("Generating data...")
-data = generate_data(1000)
+    return best_model, best_params, (X_test, y_test)
 
-print("Preparing features...")
-X, y, encoders = prepare_features(data)
+def predict_tasks(rows, model, encoders, transformer=None):
+    """Predict the task type for a batch of feature rows in one model call.
 
-print("Training model...")
-model, (X_test, y_test) = train_model(X, y)
+    ``rows`` are dicts keyed by the model's feature columns, with
+    categorical features given as their original labels. With a fitted
+    ``transformer`` they are raw interactions instead and all features are
+    built by it. Returns the predicted task labels and the model's
+    confidence in each.
+    """
+    if transformer is not None:
+        probabilities = model.predict_proba(transformer.transform(rows))
+        predictions = transformer.decode_target(probabilities.argmax(axis=1))
+        return list(predictions), probabilities.max(axis=1).tolist()
 
-# Save the model and encoders for future use
-print("Saving model and encoders...")
-import joblib
-joblib.dump(model, 'task_prediction_model.joblib')
-joblib.dump(encoders, 'feature_encoders.joblib')
+    input_df = pd.DataFrame.from_records(rows)
 
-# Example prediction function
-def predict_task(input_features, model, encoders):
-    # Prepare input features similar to training data
-    input_df = pd.DataFrame([input_features])
-    
-    # Encode categorical features
+    # Encode categorical features column by column
     for col in input_df.columns:
         if col in encoders:
             input_df[col] = encoders[col].transform(input_df[col])
-    
-    # Make prediction
-    pred_encoded = model.predict(input_df)[0]
-    prediction = encoders['target'].inverse_transform([pred_encoded])[0]
-    
-    return prediction
 
-print("Setup complete!")
\ No newline at end of file
+    feature_names = getattr(model, 'feature_names_in_', None)
+    if feature_names is not None:
+        input_df = input_df[list(feature_names)]
+
+    probabilities = model.predict_proba(input_df)
+    pred_encoded = probabilities.argmax(axis=1)
+    predictions = encoders['target'].inverse_transform(pred_encoded)
+    return list(predictions), probabilities.max(axis=1).tolist()
+
+# Example prediction function
+def predict_task(input_features, model, encoders):
+    predictions, _ = predict_tasks([input_features], model, encoders)
+    return predictions[0]
+
+def load_interactions(source, path=None, records=1000, seed=None, mongo_uri=None):
+    """Load interactions from a CSV file, MongoDB ``user_data`` or the synthetic generator."""
+    if source == 'csv':
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path)
+        return pd.read_csv(path, parse_dates=['timestamp'])
+    if source == 'mongo':
+        from pymongo import MongoClient
+        client = MongoClient(mongo_uri or os.getenv('MONGODB_URI'))
+        projection = {name: 1 for name in INPUT_COLUMNS + ['task_type', 'user_id', 'timestamp']}
+        projection['_id'] = 0
+        cursor = client['SPIT_HACK']['user_data'].find({}, projection).sort('timestamp', -1).limit(records)
+        data = pd.DataFrame(list(cursor))
+        if data.empty:
+            raise ValueError("No interactions found in user_data")
+        return data.dropna(subset=INPUT_COLUMNS + ['task_type']).reset_index(drop=True)
+    return generate_data(records, seed=seed)
+
+def evaluate_model(model, transformer, data):
+    """Print and return the model's accuracy on labelled interactions."""
+    from sklearn.metrics import accuracy_score, classification_report
+
+    y = transformer.encode_target(data[transformer.target])
+    known = y >= 0
+    if not known.all():
+        print(f"Skipping {int((~known).sum())} rows with task types unseen in training")
+    X = transformer.transform(data[known])
+    y_pred = model.predict(X)
+    accuracy = accuracy_score(y[known], y_pred)
+    print(f"Accuracy: {accuracy:.3f} on {int(known.sum())} rows")
+    print(classification_report(
+        y[known], y_pred,
+        labels=list(range(len(transformer.target_classes))),
+        target_names=list(transformer.target_classes),
+        zero_division=0
+    ))
+    return accuracy
+
+def export_model(model, transformer, output_dir):
+    """Write the booster as XGBoost JSON and the transformer's state as plain JSON."""
+    os.makedirs(output_dir, exist_ok=True)
+    model.save_model(os.path.join(output_dir, 'task_prediction_model.json'))
+    with open(os.path.join(output_dir, 'feature_transformer.json'), 'w') as f:
+        json.dump({
+            'feature_columns': transformer.feature_columns,
+            'categories': {name: list(values) for name, values in transformer.categories.items()},
+            'target_classes': list(transformer.target_classes),
+            'numerical_means': transformer.means.tolist(),
+            'numerical_scales': transformer.scales.tolist()
+        }, f, indent=2)
+    print(f"Exported model and transformer to {output_dir}")
+
+def load_checkpoint(path):
+    """Training checkpoint from the last incremental update, or an empty one."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_checkpoint(checkpoint, path):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temp_path, path)
+
+def save_atomic(artifact, path):
+    """Write an artifact next to ``path`` and swap it in with a single rename.
+
+    Readers (e.g. predict_service) see either the old or the new file, never
+    a partially written one.
+    """
+    import joblib
+
+    temp_path = f"{path}.tmp"
+    joblib.dump(artifact, temp_path)
+    os.replace(temp_path, path)
+
+def pair_with(model, transformer):
+    """Record on ``model`` the version of the transformer that built its features."""
+    model.transformer_version_ = getattr(transformer, 'version', None)
+    return model
+
+def is_pair(model, transformer):
+    """Whether ``model`` was trained on features from this ``transformer``."""
+    return getattr(model, 'transformer_version_', None) == getattr(transformer, 'version', None)
+
+def load_new_interactions(collection, checkpoint=None, overlap_seconds=CHECKPOINT_OVERLAP_SECONDS, limit=None):
+    """``user_data`` documents inserted since ``checkpoint``, oldest first.
+
+    ObjectIds are ordered only to the second, and ids made by other clients
+    can trail by clock skew, so reading resumes ``overlap_seconds`` before
+    the newest id seen and skips the ids the checkpoint recorded from that
+    window. Returns the interactions and the ``{'since', 'seen_ids'}`` part
+    of the next checkpoint.
+    """
+    from bson import ObjectId
+
+    checkpoint = checkpoint or {}
+    overlap = timedelta(seconds=overlap_seconds)
+    seen_ids = set(checkpoint.get('seen_ids', []))
+    legacy_last_id = None
+    if checkpoint.get('since'):
+        since = datetime.fromisoformat(checkpoint['since'])
+    elif checkpoint.get('last_id'):
+        # Checkpoints from before the overlap window only recorded the last _id
+        legacy_last_id = ObjectId(checkpoint['last_id'])
+        since = legacy_last_id.generation_time
+    else:
+        since = None
+
+    projection = {name: 1 for name in INPUT_COLUMNS + ['task_type', 'user_id', 'timestamp']}
+    query = {'_id': {'$gte': ObjectId.from_datetime(since - overlap)}} if since else {}
+    cursor = collection.find(query, projection).sort('_id', 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    documents = list(cursor)
+    state = {'since': since.isoformat() if since else None, 'seen_ids': sorted(seen_ids)}
+    if not documents:
+        return pd.DataFrame(columns=INPUT_COLUMNS + ['task_type']), state
+
+    newest = max(since, documents[-1]['_id'].generation_time) if since else documents[-1]['_id'].generation_time
+    state = {
+        'since': newest.isoformat(),
+        'seen_ids': [str(doc['_id']) for doc in documents if doc['_id'].generation_time >= newest - overlap]
+    }
+    documents = [
+        doc for doc in documents
+        if str(doc['_id']) not in seen_ids and (legacy_last_id is None or doc['_id'] > legacy_last_id)
+    ]
+    if not documents:
+        return pd.DataFrame(columns=INPUT_COLUMNS + ['task_type']), state
+    data = pd.DataFrame(documents).drop(columns=['_id'])
+    return data.dropna(subset=INPUT_COLUMNS + ['task_type']).reset_index(drop=True), state
+
+def labelled_features(transformer, data):
+    """Features and encoded targets for rows whose task type the model knows."""
+    y = transformer.encode_target(data[transformer.target])
+    known = y >= 0
+    return transformer.transform(data[known]), y[known]
+
+def boost_all_classes(model, X, y, rounds, xgb_model=None):
+    """Train ``rounds`` trees with ``model``'s parameters over all of its classes.
+
+    Uses the booster API with an explicit ``num_class``, so a batch missing
+    some task types still yields the full multi-class model.
+    """
+    import xgboost as xgb
+
+    params = {name: value for name, value in model.get_xgb_params().items() if value is not None}
+    params['num_class'] = int(model.n_classes_)
+    booster = xgb.train(params, xgb.DMatrix(X, label=y), num_boost_round=rounds, xgb_model=xgb_model)
+    # Forget early stopping from the original fit so prediction uses every tree
+    booster.set_attr(best_iteration=None, best_score=None)
+
+    updated = xgb.XGBClassifier(**model.get_params())
+    updated.load_model(bytearray(booster.save_raw('json')))
+    return updated
+
+def continue_boosting(model, transformer, data, rounds=50):
+    """Add ``rounds`` trees to ``model``, fitted on ``data`` only."""
+    X, y = labelled_features(transformer, data)
+    return boost_all_classes(model, X, y, rounds, xgb_model=model.get_booster())
+
+def refit_window(model, transformer, data):
+    """Refit a model with the same parameters on a sliding window of recent data."""
+    X, y = labelled_features(transformer, data)
+    return boost_all_classes(model, X, y, model.get_params().get('n_estimators') or 100)
+
+def update_model(model_path, transformer_path, checkpoint_path, mode='continue', rounds=50,
+                 window=50000, min_rows=100, mongo_uri=None, overlap_seconds=CHECKPOINT_OVERLAP_SECONDS):
+    """Fold ``user_data`` added since the last checkpoint into the served model.
+
+    ``continue`` boosts ``rounds`` more trees on just the new rows; ``window``
+    refits on the ``window`` most recent rows. The fitted transformer is kept
+    as is so served features do not change. The new model replaces the old
+    one atomically and the checkpoint advances only after the swap.
+    """
+    import joblib
+    from pymongo import MongoClient
+
+    collection = MongoClient(mongo_uri or os.getenv('MONGODB_URI'))['SPIT_HACK']['user_data']
+    checkpoint = load_checkpoint(checkpoint_path)
+    new_data, state = load_new_interactions(collection, checkpoint, overlap_seconds)
+    if len(new_data) < min_rows:
+        print(f"Only {len(new_data)} new interactions since the last checkpoint, skipping update")
+        return False
+
+    model = joblib.load(model_path)
+    transformer = joblib.load(transformer_path)
+    if not is_pair(model, transformer):
+        raise ValueError(f"{model_path} was not trained with {transformer_path}; retrain before updating")
+    print(f"Updating model with {len(new_data)} new interactions ({mode} mode)...")
+    if mode == 'window':
+        window_data = load_interactions('mongo', records=window, mongo_uri=mongo_uri)
+        model = refit_window(model, transformer, window_data)
+    else:
+        model = continue_boosting(model, transformer, new_data, rounds)
+
+    save_atomic(pair_with(model, transformer), model_path)
+    save_checkpoint({
+        **state,
+        'rows_seen': checkpoint.get('rows_seen', 0) + len(new_data),
+        'mode': mode,
+        'updated_at': datetime.now().isoformat()
+    }, checkpoint_path)
+    print(f"Model updated and swapped in at {model_path}")
+    return True
+
+def add_source_arguments(parser):
+    parser.add_argument('--source', choices=['synthetic', 'csv', 'mongo'], default='synthetic',
+                        help="Where to read interactions from")
+    parser.add_argument('--input', help="CSV (or .parquet) file to read with --source csv")
+    parser.add_argument('--mongo-uri', help="MongoDB URI for --source mongo (defaults to MONGODB_URI)")
+    parser.add_argument('--records', type=int, default=1000,
+                        help="Synthetic rows to generate, or most recent user_data rows to read")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for data generation and training")
+
+def add_artifact_arguments(parser):
+    parser.add_argument('--model-path', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--transformer-path', default=DEFAULT_TRANSFORMER_PATH)
+
+def command_generate(args):
+    write_data(args.output, args.records, chunk_size=args.chunk_size, seed=args.seed, num_users=args.users)
+
+def command_train(args):
+    import joblib
+
+    print("Loading data...")
+    data = load_interactions(args.source, args.input, args.records, args.seed, args.mongo_uri)
+
+    print("Preparing features...")
+    X, y, transformer = prepare_features(data)
+
+    print("Training model...")
+    warm_start = None if args.no_warm_start else load_best_params(args.params_path)
+    model, best_params, _ = train_model(
+        X, y,
+        search=args.search,
+        budget_seconds=args.budget,
+        warm_start=warm_start,
+        search_workers=args.workers,
+        random_state=args.seed
+    )
+    save_best_params(best_params, args.params_path)
+
+    # Save the model, the fitted feature transformer and its encoders. The
+    # model records the transformer's version, so a service reloading
+    # between the two swaps waits for the matching model.
+    print("Saving model, feature transformer and encoders...")
+    save_atomic(transformer, args.transformer_path)
+    save_atomic(pair_with(model, transformer), args.model_path)
+    joblib.dump(transformer.label_encoders(), args.encoders_path)
+    print("Setup complete!")
+
+def command_evaluate(args):
+    import joblib
+
+    data = load_interactions(args.source, args.input, args.records, args.seed, args.mongo_uri)
+    evaluate_model(joblib.load(args.model_path), joblib.load(args.transformer_path), data)
+
+def command_update(args):
+    update_model(
+        args.model_path, args.transformer_path, args.checkpoint_path,
+        mode=args.mode,
+        rounds=args.rounds,
+        window=args.window,
+        min_rows=args.min_rows,
+        mongo_uri=args.mongo_uri,
+        overlap_seconds=args.overlap_seconds
+    )
+
+def command_export(args):
+    import joblib
+
+    export_model(joblib.load(args.model_path), joblib.load(args.transformer_path), args.output_dir)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate data for, train, update, evaluate and export the task prediction model.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help="Write synthetic interactions to CSV or Parquet")
+    generate.add_argument('--records', type=int, default=1000)
+    generate.add_argument('--seed', type=int, default=42)
+    generate.add_argument('--users', type=int, default=50)
+    generate.add_argument('--chunk-size', type=int, default=500000, help="Rows generated and written per chunk")
+    generate.add_argument('--output', default='user_interaction_data.csv',
+                          help="Output file; a .parquet extension writes Parquet")
+    generate.set_defaults(func=command_generate)
+
+    train = subparsers.add_parser('train', help="Fit the feature transformer and model")
+    add_source_arguments(train)
+    add_artifact_arguments(train)
+    train.add_argument('--encoders-path', default=DEFAULT_ENCODERS_PATH)
+    train.add_argument('--params-path', default=BEST_PARAMS_PATH,
+                       help="Best parameters to warm-start from and update")
+    train.add_argument('--no-warm-start', action='store_true')
+    train.add_argument('--search', choices=['halving', 'grid'], default='halving')
+    train.add_argument('--budget', type=float, default=TRAIN_BUDGET_SECONDS,
+                       help="Wall-clock budget for the search in seconds")
+    train.add_argument('--workers', type=int, help="Concurrent fits (defaults to a quarter of the cores)")
+    train.set_defaults(func=command_train)
+
+    evaluate = subparsers.add_parser('evaluate', help="Score saved artifacts on labelled interactions")
+    add_source_arguments(evaluate)
+    add_artifact_arguments(evaluate)
+    evaluate.set_defaults(func=command_evaluate)
+
+    update = subparsers.add_parser('update', help="Fold new user_data into the saved model")
+    add_artifact_arguments(update)
+    update.add_argument('--mongo-uri', help="MongoDB URI (defaults to MONGODB_URI)")
+    update.add_argument('--checkpoint-path', default=DEFAULT_CHECKPOINT_PATH)
+    update.add_argument('--mode', choices=['continue', 'window'], default='continue',
+                        help="Boost more trees on the new rows, or refit on a recent window")
+    update.add_argument('--rounds', type=int, default=50, help="Trees added in continue mode")
+    update.add_argument('--window', type=int, default=50000, help="Recent rows refitted in window mode")
+    update.add_argument('--min-rows', type=int, default=100, help="Skip the update below this many new rows")
+    update.add_argument('--overlap-seconds', type=float, default=CHECKPOINT_OVERLAP_SECONDS,
+                        help="How far before the checkpoint to re-read for late-arriving ObjectIds")
+    update.set_defaults(func=command_update)
+
+    export = subparsers.add_parser('export', help="Export saved artifacts to portable JSON")
+    add_artifact_arguments(export)
+    export.add_argument('--output-dir', default='export')
+    export.set_defaults(func=command_export)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
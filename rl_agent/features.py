@@ -0,0 +1,128 @@
+import uuid
+
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_FEATURES = [
+    "agent_used", "completion_status", "priority_level",
+    "language", "follow_up_required"
+]
+NUMERICAL_FEATURES = [
+    'hour_of_day', 'day_of_week', 'interaction_duration',
+    'response_time', 'feedback_score', 'sentiment_score',
+    'efficiency_score'
+]
+FLAG_FEATURES = ['is_weekend', 'is_work_hours']
+FEATURE_COLUMNS = CATEGORICAL_FEATURES + NUMERICAL_FEATURES + FLAG_FEATURES
+
+# Raw interaction fields the transformer needs to build every feature
+INPUT_COLUMNS = [
+    "hour_of_day", "day_of_week", "agent_used", "interaction_duration",
+    "completion_status", "priority_level", "response_time", "feedback_score",
+    "language", "sentiment_score", "follow_up_required"
+]
+
+class FeatureTransformer:
+    """Fit-once feature pipeline shared by training and serving.
+
+    ``fit`` learns the category vocabularies, the target classes and the
+    scaling statistics; ``transform`` then turns any batch of raw
+    interactions into model features with vectorized pandas/NumPy
+    operations and no refitting. Persist it next to the model so serving
+    reproduces training features exactly. Each fit gets a new ``version``,
+    which the model trained on it records, so a mismatched pair is caught.
+    """
+
+    def __init__(self, target="task_type"):
+        self.target = target
+        self.categories = {}
+        self.target_classes = None
+        self.means = None
+        self.scales = None
+        self.version = None
+
+    @property
+    def feature_columns(self):
+        return list(FEATURE_COLUMNS)
+
+    @staticmethod
+    def _engineer(data):
+        # Time-based flags and the interaction feature, computed column-wise
+        df = pd.DataFrame(index=data.index)
+        df['is_weekend'] = (data['day_of_week'].to_numpy() >= 5).astype(np.int64)
+        hours = data['hour_of_day'].to_numpy()
+        df['is_work_hours'] = ((hours >= 9) & (hours <= 17)).astype(np.int64)
+        df['efficiency_score'] = data['interaction_duration'].to_numpy() / data['response_time'].to_numpy()
+        return df
+
+    def fit(self, data):
+        """Learn vocabularies, target classes and scaling from ``data``."""
+        self.categories = {
+            column: np.sort(data[column].astype(str).unique()) for column in CATEGORICAL_FEATURES
+        }
+        if self.target in data:
+            self.target_classes = np.sort(data[self.target].astype(str).unique())
+        engineered = self._engineer(data)
+        numerical = np.column_stack([
+            engineered[column] if column in engineered else data[column] for column in NUMERICAL_FEATURES
+        ]).astype(float)
+        self.means = numerical.mean(axis=0)
+        self.scales = numerical.std(axis=0)
+        self.scales[self.scales == 0] = 1.0
+        self.version = uuid.uuid4().hex
+        return self
+
+    def transform(self, data):
+        """Build the model's feature frame for a batch of raw interactions.
+
+        Categories not seen during ``fit`` are encoded as -1.
+        """
+        if self.means is None:
+            raise ValueError("FeatureTransformer must be fitted before transform")
+        if not isinstance(data, pd.DataFrame):
+            data = pd.DataFrame.from_records(data)
+        engineered = self._engineer(data)
+
+        features = {}
+        for column in CATEGORICAL_FEATURES:
+            features[column] = pd.Categorical(
+                data[column].astype(str), categories=self.categories[column]).codes.astype(np.int64)
+        numerical = np.column_stack([
+            engineered[column] if column in engineered else data[column] for column in NUMERICAL_FEATURES
+        ]).astype(float)
+        scaled = (numerical - self.means) / self.scales
+        for index, column in enumerate(NUMERICAL_FEATURES):
+            features[column] = scaled[:, index]
+        for column in FLAG_FEATURES:
+            features[column] = engineered[column].to_numpy()
+        return pd.DataFrame(features, index=data.index, columns=FEATURE_COLUMNS)
+
+    def fit_transform(self, data):
+        return self.fit(data).transform(data)
+
+    def unknown_categories(self, data):
+        """Map each categorical column to the values ``fit`` never saw."""
+        unknown = {}
+        for column in CATEGORICAL_FEATURES:
+            values = set(pd.Series(data[column]).astype(str)) - set(self.categories[column])
+            if values:
+                unknown[column] = sorted(values)
+        return unknown
+
+    def encode_target(self, values):
+        """Encode target labels as class indices (unseen labels become -1)."""
+        return pd.Categorical(pd.Series(values).astype(str), categories=self.target_classes).codes.astype(np.int64)
+
+    def decode_target(self, codes):
+        return self.target_classes[np.asarray(codes)]
+
+    def label_encoders(self):
+        """Equivalent fitted LabelEncoders, in the format of feature_encoders.joblib."""
+        from sklearn.preprocessing import LabelEncoder
+
+        encoders = {}
+        for name, classes in [('target', self.target_classes)] + list(self.categories.items()):
+            encoder = LabelEncoder()
+            encoder.classes_ = classes
+            encoders[name] = encoder
+        return encoders
@@ -1,8 +1,18 @@
-from flask import Flask, jsonify, request
-from pymongo import MongoClient
+from flask import Flask, Response, g, has_request_context, jsonify, request, stream_with_context
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
 import google.generativeai as genai
 from datetime import datetime, timedelta
 import os
+import json
+import queue
+import threading
+import time
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from dotenv import load_dotenv
 import numpy as np
 import random
@@ -11,14 +21,16 @@ from flask import Flask, jsonify
 from collections import defaultdict
 import numpy as np
 import random
-import tensorflow as tf
-from collections import defaultdict
-from scipy.stats import beta, norm
+from collections import Counter, OrderedDict, defaultdict
+from itertools import groupby
+from scipy.stats import norm
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.cluster import KMeans
-from keras.models import Sequential
-from keras.layers import Dense
+import joblib
 from flask_cors import CORS
+import atexit
+
+from data import AGENTS, LANGUAGES, PRIORITIES, STATUSES, TASK_NAMES
 
 # Load environment variables
 load_dotenv()
@@ -30,24 +42,984 @@ CORS(app)
 client = MongoClient(os.getenv('MONGODB_URI'))
 db = client['SPIT_HACK']
 user_actions_collection = db['user_data']
+user_aggregates_collection = db['user_aggregates']
+suggestion_cache_collection = db['suggestion_cache']
+user_suggestions_collection = db['user_suggestions']
+agent_bandit_collection = db['agent_bandit_state']
+task_transitions_collection = db['task_transitions']
+user_data_daily_collection = db['user_data_daily']
+
+# Ranker configuration
+RANDOM_SEED = int(os.getenv('RL_RANDOM_SEED')) if os.getenv('RL_RANDOM_SEED') else None
+MONTE_CARLO_SAMPLES = int(os.getenv('RL_MONTE_CARLO_SAMPLES', 1000))
+MONTE_CARLO_MAX_SAMPLES = int(os.getenv('RL_MONTE_CARLO_MAX_SAMPLES', 20000))
+MONTE_CARLO_CONFIDENCE = float(os.getenv('RL_MONTE_CARLO_CONFIDENCE', 0.95))
+MONTE_CARLO_CHUNK_ELEMENTS = 1_000_000  # Caps the size of each sampled block
+
+# History window configuration
+HISTORY_MAX_ACTIONS = int(os.getenv('RL_HISTORY_MAX_ACTIONS', 500))
+HISTORY_MAX_AGE_DAYS = float(os.getenv('RL_HISTORY_MAX_AGE_DAYS', 0)) or None  # 0/unset means no age limit
+HISTORY_LIMIT_CEILING = int(os.getenv('RL_HISTORY_LIMIT_CEILING', 5000))
+HISTORY_FETCH_CONCURRENCY = int(os.getenv('RL_HISTORY_FETCH_CONCURRENCY', 8))  # Parallel per-user reads in batches
+HISTORY_PROJECTION = {
+    '_id': 0, 'timestamp': 1, 'hour_of_day': 1, 'agent_used': 1, 'task_type': 1,
+    'completion_status': 1, 'priority_level': 1, 'feedback_score': 1, 'reward': 1, 'state': 1
+}
+
+# Batch configuration
+BATCH_MAX_USERS = int(os.getenv('RL_BATCH_MAX_USERS', 100))
+BATCH_LLM_CONCURRENCY = int(os.getenv('RL_BATCH_LLM_CONCURRENCY', 8))
+
+# Precomputed suggestions older than this are ignored by the GET endpoint
+PRECOMPUTE_MAX_AGE_SECONDS = int(os.getenv('RL_PRECOMPUTE_MAX_AGE_SECONDS', 3600))
+
+# Streaming configuration
+STREAM_DEADLINE_SECONDS = float(os.getenv('RL_STREAM_DEADLINE_SECONDS', 30))
+
+# Prompt configuration
+PROMPT_TOKEN_BUDGET = int(os.getenv('RL_PROMPT_TOKEN_BUDGET', 1500))
+PROMPT_RECENT_ACTIONS = int(os.getenv('RL_PROMPT_RECENT_ACTIONS', 10))
+CHARS_PER_TOKEN = 4  # Rough estimate for Gemini tokenization
+
+# Suggestion cache configuration
+SUGGESTION_CACHE_SIZE = int(os.getenv('RL_SUGGESTION_CACHE_SIZE', 1024))
+SUGGESTION_CACHE_TTL = int(os.getenv('RL_SUGGESTION_CACHE_TTL', 300))
+SUGGESTION_CACHE_MONGO = os.getenv('RL_SUGGESTION_CACHE_MONGO', 'false').lower() in ('1', 'true', 'yes')
+
+# Beta prior of every (user, agent) Thompson-sampling arm
+BANDIT_PRIOR_ALPHA = float(os.getenv('RL_BANDIT_PRIOR_ALPHA', 2))
+BANDIT_PRIOR_BETA = float(os.getenv('RL_BANDIT_PRIOR_BETA', 5))
+
+# Ranker pipeline configuration
+DEFAULT_RANKER_STAGES = tuple(
+    stage.strip() for stage in os.getenv(
+        'RL_RANKER_STAGES', 'q_learning,monte_carlo,policy_gradient,multi_armed_bandit,bayesian'
+    ).split(',') if stage.strip()
+)
+RANKER_PROFILE_ALLOCATIONS = os.getenv('RL_RANKER_PROFILE_ALLOCATIONS', 'false').lower() in ('1', 'true', 'yes')
+
+# Ranker model registry configuration
+RANKER_MODEL_DIR = os.getenv('RL_RANKER_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+RANKER_RETRAIN_SECONDS = int(os.getenv('RL_RANKER_RETRAIN_SECONDS', 6 * 3600))  # 0 disables retraining
+RANKER_TRAINING_SAMPLE = int(os.getenv('RL_RANKER_TRAINING_SAMPLE', 50000))
+RANKER_MIN_SEGMENT_SIZE = int(os.getenv('RL_RANKER_MIN_SEGMENT_SIZE', 200))
+
+# Ranker process pool configuration
+RANKER_POOL_WORKERS = int(os.getenv('RL_RANKER_POOL_WORKERS', min(4, os.cpu_count() or 1)))  # 0 ranks in-thread
+RANKER_POOL_TIMEOUT_SECONDS = float(os.getenv('RL_RANKER_POOL_TIMEOUT_SECONDS', 2))
+RANKER_FALLBACK_STAGES = tuple(
+    stage.strip() for stage in os.getenv('RL_RANKER_FALLBACK_STAGES', 'policy_gradient,multi_armed_bandit').split(',')
+    if stage.strip()
+)
+
+# Interaction ingestion configuration
+INGEST_MAX_REQUEST_ITEMS = int(os.getenv('RL_INGEST_MAX_REQUEST_ITEMS', 5000))
+INGEST_FLUSH_SIZE = int(os.getenv('RL_INGEST_FLUSH_SIZE', 1000))
+INGEST_FLUSH_SECONDS = float(os.getenv('RL_INGEST_FLUSH_SECONDS', 1.0))
+INGEST_MAX_PENDING = int(os.getenv('RL_INGEST_MAX_PENDING', 50000))  # Beyond this, requests flush synchronously
+INGEST_MAX_ATTEMPTS = int(os.getenv('RL_INGEST_MAX_ATTEMPTS', 5))  # Insert attempts before a batch is dropped
+
+# Markov next-task model configuration
+TRANSITION_TOP_K = int(os.getenv('RL_TRANSITION_TOP_K', 3))
+TRANSITION_MIN_COUNT = int(os.getenv('RL_TRANSITION_MIN_COUNT', 3))  # Evidence needed before a level is used
+TRANSITION_CACHE_SIZE = int(os.getenv('RL_TRANSITION_CACHE_SIZE', 4096))
+TRANSITION_CACHE_TTL = int(os.getenv('RL_TRANSITION_CACHE_TTL', 300))
 
 # Initialize Gemini
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
 model = genai.GenerativeModel('gemini-2.0-flash')
 
+def aggregate_key(value):
+    """Make a value safe to use as a MongoDB field name."""
+    return str(value).replace('.', '\uff0e').replace('$', '\uff04')
+
+def aggregate_increments(actions):
+    """Fold a batch of actions into a flat ``$inc`` document.
+
+    Returns the increments and the latest timestamp seen in the batch.
+    """
+    increments = defaultdict(int)
+    last_timestamp = None
+    for action in actions:
+        agent = aggregate_key(action.get('agent_used', 'default'))
+        increments['action_count'] += 1
+        increments[f"agent_counts.{agent}"] += 1
+        increments[f"agent_reward_sums.{agent}"] += action.get('reward', 1)
+        increments[f"task_counts.{aggregate_key(action.get('task_type', 'unknown'))}"] += 1
+        increments[f"priority_counts.{aggregate_key(action.get('priority_level', 'unknown'))}"] += 1
+        if action.get('feedback_score') is not None:
+            increments['feedback_sum'] += action['feedback_score']
+            increments['feedback_count'] += 1
+        timestamp = action.get('timestamp')
+        if timestamp is not None and (last_timestamp is None or timestamp > last_timestamp):
+            last_timestamp = timestamp
+    return dict(increments), last_timestamp
+
+def aggregate_update(actions):
+    """The update document that applies ``actions`` to an aggregate document."""
+    increments, last_timestamp = aggregate_increments(actions)
+    if not increments:
+        return None
+    update = {
+        '$inc': increments,
+        '$set': {'updated_at': datetime.now(timezone.utc)}
+    }
+    if last_timestamp is not None:
+        update['$max'] = {'last_timestamp': last_timestamp}
+    return update
+
+class NewestIdTracker:
+    """Iterates over documents, remembering the newest ObjectId ``_id`` seen."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.newest_id = None
+
+    def __iter__(self):
+        for document in self.documents:
+            document_id = document.get('_id')
+            if isinstance(document_id, ObjectId) and (self.newest_id is None or document_id > self.newest_id):
+                self.newest_id = document_id
+            yield document
+
+def oldest_object_id(actions):
+    ids = [action['_id'] for action in actions if isinstance(action.get('_id'), ObjectId)]
+    return min(ids) if ids else None
+
+def already_counted(document, actions):
+    """Whether a rebuild of ``document`` already read some of ``actions``.
+
+    Rebuilds record the newest ``user_data`` ``_id`` they counted as
+    ``counted_through``. A rebuild that ran after these actions were
+    inserted (e.g. a drift check racing the ingestion flush) has them
+    included, so applying them again as increments would double count.
+    """
+    oldest = oldest_object_id(actions)
+    counted_through = document.get('counted_through')
+    return oldest is not None and counted_through is not None and counted_through >= oldest
+
+def not_counted_filter(user_id, actions):
+    """Filter that matches the user's document only while a rebuild has not
+    yet counted ``actions``, guarding increments against a racing rebuild."""
+    oldest = oldest_object_id(actions)
+    if oldest is None:
+        return {'_id': user_id}
+    return {'_id': user_id, 'counted_through': {'$not': {'$gte': oldest}}}
+
+def update_many_user_aggregates(actions_by_user):
+    """Apply newly inserted actions of several users with one bulk write.
+
+    Users without an aggregate document yet, or whose document a rebuild
+    already brought past these actions, are rebuilt from their full
+    history instead, which includes the new actions exactly once.
+    """
+    user_ids = list(actions_by_user)
+    existing = {
+        doc['_id']: doc
+        for doc in user_aggregates_collection.find({'_id': {'$in': user_ids}}, {'counted_through': 1})
+    }
+    operations = []
+    for user_id in user_ids:
+        actions = actions_by_user[user_id]
+        if user_id not in existing or already_counted(existing[user_id], actions):
+            rebuild_user_aggregates(user_id)
+            continue
+        update = aggregate_update(actions)
+        if update is not None:
+            operations.append(UpdateOne(not_counted_filter(user_id, actions), update))
+    if operations:
+        user_aggregates_collection.bulk_write(operations, ordered=False)
+
+def nest_increments(increments, document):
+    """Expand dotted ``$inc`` paths into nested fields of ``document``."""
+    for path, value in increments.items():
+        target = document
+        *parents, leaf = path.split('.')
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value
+    return document
+
+# Fields of an aggregate document that daily rollups also carry
+AGGREGATE_FIELDS = ('action_count', 'agent_counts', 'agent_reward_sums', 'task_counts', 'priority_counts',
+                    'feedback_sum', 'feedback_count')
+
+def flatten_counts(document, fields):
+    """Dotted ``$inc``-style paths for the numeric ``fields`` of a stored document."""
+    flat = {}
+    for field in fields:
+        value = document.get(field)
+        if isinstance(value, dict):
+            for path, nested in flatten_counts(value, list(value)).items():
+                flat[f"{field}.{path}"] = nested
+        elif isinstance(value, (int, float)):
+            flat[field] = value
+    return flat
+
+def merge_increments(target, increments):
+    for path, value in increments.items():
+        target[path] = target.get(path, 0) + value
+    return target
+
+def rollup_increments(match, fields):
+    """Sum ``fields`` over the ``user_data_daily`` rollups matching ``match``.
+
+    Returns the summed increments and the latest timestamp rolled up.
+    """
+    totals = {}
+    last_timestamp = None
+    projection = {field: 1 for field in fields}
+    projection['last_timestamp'] = 1
+    for document in user_data_daily_collection.find(match, projection):
+        merge_increments(totals, flatten_counts(document, fields))
+        timestamp = document.get('last_timestamp')
+        if timestamp is not None and (last_timestamp is None or timestamp > last_timestamp):
+            last_timestamp = timestamp
+    return totals, last_timestamp
+
+def rolled_last_action(user_id):
+    """The last action folded into the user's daily rollups, which the
+    transition chain of their later actions continues from."""
+    rollup = user_data_daily_collection.find_one(
+        {'user_id': str(user_id), 'last_action': {'$exists': True}}, {'last_action': 1}, sort=[('day', -1)]
+    )
+    return rollup['last_action'] if rollup else None
+
+def rebuild_user_aggregates(user_id):
+    """Recompute a user's aggregate document from their full history.
+
+    The history is the raw actions still in ``user_data`` plus the daily
+    rollups of older ones. Only used to backfill users that have no
+    aggregate document yet, or to repair one that drifted behind
+    ``user_data``.
+    """
+    cursor = NewestIdTracker(user_actions_collection.find(
+        {'user_id': str(user_id)},
+        {'agent_used': 1, 'task_type': 1, 'priority_level': 1, 'feedback_score': 1, 'reward': 1, 'timestamp': 1}
+    ))
+    increments, last_timestamp = aggregate_increments(cursor)
+    rolled, rolled_last_timestamp = rollup_increments({'user_id': str(user_id)}, AGGREGATE_FIELDS)
+    merge_increments(increments, rolled)
+    last_timestamp = last_timestamp or rolled_last_timestamp
+    if not increments:
+        return None
+
+    aggregates = nest_increments(increments, {'_id': str(user_id), 'last_timestamp': last_timestamp,
+                                              'counted_through': cursor.newest_id,
+                                              'updated_at': datetime.now(timezone.utc)})
+    user_aggregates_collection.replace_one({'_id': str(user_id)}, aggregates, upsert=True)
+    return aggregates
+
+def utc_naive(timestamp):
+    """Normalize a timestamp to naive UTC, as MongoDB returns them.
+
+    ISO 8601 strings (e.g. rows imported verbatim from CSV) are parsed;
+    anything else unparseable becomes None.
+    """
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+        except ValueError:
+            return None
+    if not isinstance(timestamp, datetime):
+        return None
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def aggregates_drifted(user_id, aggregates):
+    """Whether ``user_data`` holds actions newer than the aggregate document.
+
+    Actions written through the ingestion buffer advance ``last_timestamp``
+    together with the counts; rows written to ``user_data`` directly
+    (imports, other services) do not. One indexed lookup of the user's
+    newest action tells the two apart. Timestamps that cannot be compared
+    count as no drift, so the check never fails a read.
+    """
+    try:
+        latest = user_actions_collection.find_one(
+            {'user_id': str(user_id)}, {'_id': 0, 'timestamp': 1}, sort=[('timestamp', -1)]
+        )
+        latest = utc_naive((latest or {}).get('timestamp'))
+        if latest is None:
+            return False
+        if aggregates.get('last_timestamp') is None:
+            return True
+        stored = utc_naive(aggregates['last_timestamp'])
+        return stored is not None and latest > stored
+    except Exception as e:
+        print(f"[Error] Drift check for user {user_id} failed: {str(e)}")
+        return False
+
+def refresh_user_aggregates(user_id):
+    """Rebuild a user's aggregates and task transitions after drift."""
+    print(f"[RL] Aggregates for user {user_id} are behind user_data, rebuilding...")
+    aggregates = rebuild_user_aggregates(user_id)
+    task_transitions.rebuild_user(user_id)
+    return aggregates
+
+def get_many_user_aggregates(user_ids):
+    """Return aggregate documents for several users, backfilling any missing
+    and rebuilding any that drifted behind ``user_data``."""
+    user_ids = [str(user_id) for user_id in user_ids]
+    aggregates = {doc['_id']: doc for doc in user_aggregates_collection.find({'_id': {'$in': user_ids}})}
+    for user_id in user_ids:
+        if user_id not in aggregates:
+            print(f"[RL] Backfilling aggregates for user {user_id}...")
+            aggregates[user_id] = rebuild_user_aggregates(user_id)
+        elif aggregates_drifted(user_id, aggregates[user_id]):
+            aggregates[user_id] = refresh_user_aggregates(user_id)
+    return aggregates
+
+def get_user_aggregates(user_id):
+    """Return the user's aggregate document, backfilling it on first use and
+    rebuilding it if it drifted behind ``user_data``."""
+    aggregates = user_aggregates_collection.find_one({'_id': str(user_id)})
+    if aggregates is None:
+        print(f"[RL] Backfilling aggregates for user {user_id}...")
+        aggregates = rebuild_user_aggregates(user_id)
+    elif aggregates_drifted(user_id, aggregates):
+        aggregates = refresh_user_aggregates(user_id)
+    return aggregates
+
+def insert_user_actions(actions):
+    """Insert new actions into ``user_data`` with one unordered ``insert_many``.
+
+    Safe to retry with the same documents: ``insert_many`` gives each one
+    its ``_id`` on the first attempt, so rows a failed attempt already
+    wrote come back as duplicate key errors, which are ignored.
+    """
+    try:
+        user_actions_collection.insert_many(actions, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if e.details.get('writeConcernErrors') or any(error.get('code') != 11000 for error in errors):
+            raise
+
+def actions_by_user(actions):
+    by_user = defaultdict(list)
+    for action in actions:
+        by_user[str(action['user_id'])].append(action)
+    return by_user
+
+def update_derived_state(by_user):
+    """Apply recorded actions to the aggregates and task transitions, and
+    drop the users' cached suggestions."""
+    update_many_user_aggregates(by_user)
+    for user_id in by_user:
+        suggestion_cache.invalidate(user_id)
+    task_transitions.record(by_user)
+
+def repair_derived_state(user_ids):
+    """Rebuild the aggregates and task transitions of ``user_ids`` from their
+    history, after an update that may have been partly applied."""
+    for user_id in user_ids:
+        rebuild_user_aggregates(user_id)
+        task_transitions.rebuild_user(user_id)
+        suggestion_cache.invalidate(user_id)
+
+def action_rewards(actions):
+    return [
+        (action['user_id'], action['agent_used'], action['reward'])
+        for action in actions if action.get('reward') is not None and action.get('agent_used')
+    ]
+
+# Interaction schema accepted by the ingestion endpoint, mirroring generate_data
+INTERACTION_REQUIRED = ('user_id', 'agent_used', 'task_type', 'completion_status', 'priority_level')
+INTERACTION_CATEGORIES = {
+    'agent_used': set(AGENTS),
+    'task_type': set(TASK_NAMES),
+    'completion_status': set(STATUSES),
+    'priority_level': set(PRIORITIES),
+    'language': set(LANGUAGES),
+    'follow_up_required': {'Yes', 'No'}
+}
+INTERACTION_NUMBERS = {  # field: (minimum, maximum, integer)
+    'hour_of_day': (0, 23, True),
+    'day_of_week': (0, 6, True),
+    'interaction_duration': (0, None, True),
+    'response_time': (1, None, True),  # efficiency_score divides by it
+    'feedback_score': (0, 5, False),
+    'sentiment_score': (-1, 1, False),
+    'reward': (0, 1, False)
+}
+INTERACTION_STRINGS = ('user_id', 'session_id', 'state')
+
+def validate_interaction(raw):
+    """Check one ingested interaction against the schema.
+
+    Returns ``(action, None)`` with the document to store, or
+    ``(None, error)``. A missing timestamp defaults to now, and a missing
+    ``hour_of_day``/``day_of_week`` is derived from the timestamp.
+    """
+    if not isinstance(raw, dict):
+        return None, "Expected an object"
+    missing = [field for field in INTERACTION_REQUIRED if raw.get(field) in (None, '')]
+    if missing:
+        return None, f"Missing fields: {', '.join(missing)}"
+    known = set(INTERACTION_CATEGORIES) | set(INTERACTION_NUMBERS) | set(INTERACTION_STRINGS) | {'timestamp'}
+    unknown = sorted(set(raw) - known)
+    if unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}"
+
+    action = {}
+    for field in INTERACTION_STRINGS:
+        if raw.get(field) is not None:
+            if not isinstance(raw[field], str):
+                return None, f"{field} must be a string"
+            action[field] = raw[field]
+    for field, allowed in INTERACTION_CATEGORIES.items():
+        if raw.get(field) is not None:
+            if raw[field] not in allowed:
+                return None, f"Unknown {field} '{raw[field]}'"
+            action[field] = raw[field]
+    for field, (minimum, maximum, integer) in INTERACTION_NUMBERS.items():
+        value = raw.get(field)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or (integer and value != int(value)):
+            return None, f"{field} must be {'an integer' if integer else 'a number'}"
+        if value < minimum or (maximum is not None and value > maximum):
+            return None, f"{field} out of range"
+        action[field] = int(value) if integer else float(value)
+
+    if raw.get('timestamp') is None:
+        timestamp = datetime.now(timezone.utc)
+    else:
+        try:
+            timestamp = datetime.fromisoformat(str(raw['timestamp']))
+        except ValueError:
+            return None, "timestamp must be an ISO 8601 string"
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+    action['timestamp'] = timestamp
+    action.setdefault('hour_of_day', timestamp.hour)
+    action.setdefault('day_of_week', timestamp.weekday())
+    return action, None
+
+class InteractionBuffer:
+    """In-memory write buffer for ingested interactions.
+
+    Requests only append to the buffer. A background thread flushes it
+    once ``flush_size`` interactions are pending or every ``flush_seconds``:
+    one ``insert_many`` into ``user_data`` plus one bulk write per derived
+    collection. If writes fall behind and ``max_pending`` is reached, the
+    request that hits the limit flushes synchronously. Flushes never overlap,
+    so each user's interactions are applied in arrival order.
+
+    Accepted interactions are not dropped on a transient error. A batch
+    whose insert fails is retried on the following flushes, up to
+    ``max_attempts`` times. Once a batch is stored, a failed derived update
+    is repaired by rebuilding the affected users from their history.
+    """
+
+    def __init__(self, flush_size, flush_seconds, max_pending, max_attempts):
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.flushed = 0
+        self.failed = 0
+        self.repaired = 0
+        self.rewards_failed = 0
+        self._pending = []
+        self._retries = []  # (actions, attempts) of batches whose insert failed, oldest first
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending) + sum(len(actions) for actions, _ in self._retries)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def add(self, actions):
+        """Queue validated actions; returns how many are now pending."""
+        self.start()
+        with self._lock:
+            self._pending.extend(actions)
+            pending = len(self._pending)
+        if pending >= self.max_pending:
+            self.flush()
+        elif pending >= self.flush_size:
+            self._wakeup.set()
+        return pending
+
+    def flush(self):
+        """Write everything pending; returns the number of interactions written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                batches, self._retries = self._retries + ([(batch, 0)] if batch else []), []
+            written = 0
+            for index, (actions, attempts) in enumerate(batches):
+                try:
+                    insert_user_actions(actions)
+                except Exception as e:
+                    # Keep later batches queued behind this one to preserve arrival order
+                    self._retry_later(actions, attempts + 1, e)
+                    with self._lock:
+                        self._retries.extend(batches[index + 1:])
+                    break
+                self._update_derived(actions)
+                self.flushed += len(actions)
+                written += len(actions)
+            return written
+
+    def _retry_later(self, actions, attempts, error):
+        if attempts >= self.max_attempts:
+            self.failed += len(actions)
+            print(f"[Error] Writing {len(actions)} interactions failed {attempts} times, dropping them: {str(error)}")
+            return
+        print(f"[Error] Writing {len(actions)} interactions failed (attempt {attempts}), will retry: {str(error)}")
+        with self._lock:
+            self._retries.append((actions, attempts))
+
+    def _update_derived(self, actions):
+        """Apply stored actions to the derived collections, repairing on failure."""
+        by_user = actions_by_user(actions)
+        try:
+            update_derived_state(by_user)
+        except Exception as e:
+            print(f"[Error] Updating aggregates for {len(by_user)} users failed, rebuilding them: {str(e)}")
+            try:
+                repair_derived_state(by_user)
+                self.repaired += len(by_user)
+            except Exception as e:
+                # Left for the drift check in get_user_aggregates to rebuild on next read
+                print(f"[Error] Rebuilding aggregates failed: {str(e)}")
+        rewards = action_rewards(actions)
+        try:
+            record_agent_rewards(rewards)
+        except Exception as e:
+            # Arms also hold /update/agent feedback, so they cannot be rebuilt from user_data
+            self.rewards_failed += len(rewards)
+            print(f"[Error] Recording {len(rewards)} bandit rewards failed: {str(e)}")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def render(self):
+        """Prometheus text exposition of the buffer state."""
+        return '\n'.join([
+            '# HELP rl_ingest_pending Interactions waiting in the write buffer, retries included.',
+            '# TYPE rl_ingest_pending gauge',
+            f'rl_ingest_pending {self.pending}',
+            '# HELP rl_ingest_flushed_total Interactions written to user_data.',
+            '# TYPE rl_ingest_flushed_total counter',
+            f'rl_ingest_flushed_total {self.flushed}',
+            '# HELP rl_ingest_failed_total Interactions dropped after exhausting their write attempts.',
+            '# TYPE rl_ingest_failed_total counter',
+            f'rl_ingest_failed_total {self.failed}',
+            '# HELP rl_ingest_repaired_users_total Users rebuilt after a failed derived update.',
+            '# TYPE rl_ingest_repaired_users_total counter',
+            f'rl_ingest_repaired_users_total {self.repaired}',
+            '# HELP rl_ingest_rewards_failed_total Bandit rewards that could not be recorded.',
+            '# TYPE rl_ingest_rewards_failed_total counter',
+            f'rl_ingest_rewards_failed_total {self.rewards_failed}'
+        ]) + '\n'
+
+interaction_buffer = InteractionBuffer(INGEST_FLUSH_SIZE, INGEST_FLUSH_SECONDS, INGEST_MAX_PENDING, INGEST_MAX_ATTEMPTS)
+atexit.register(interaction_buffer.flush)
+
+def restore_key(key):
+    """Undo ``aggregate_key`` for display."""
+    return key.replace('\uff0e', '.').replace('\uff04', '$')
+
+class UserPatternProfile:
+    """Behavioural summary of a user: usage counts and feedback totals.
+
+    Built either from the maintained aggregate document (O(1)) or from a
+    server-side ``$facet`` aggregation over ``user_data`` plus the daily
+    rollups when a time window is needed, so only a handful of scalars ever
+    leave MongoDB.
+    """
+
+    def __init__(self, user_id, action_count=0, agent_counts=None, task_counts=None,
+                 priority_counts=None, feedback_sum=0, feedback_count=0):
+        self.user_id = user_id
+        self.action_count = action_count
+        self.agent_counts = agent_counts or {}
+        self.task_counts = task_counts or {}
+        self.priority_counts = priority_counts or {}
+        self.feedback_sum = feedback_sum
+        self.feedback_count = feedback_count
+
+    @classmethod
+    def from_aggregates(cls, aggregates):
+        """Build a profile from a ``user_aggregates`` document."""
+        def restored(counts):
+            return {restore_key(key): count for key, count in (counts or {}).items()}
+
+        return cls(
+            aggregates.get('_id'),
+            action_count=aggregates.get('action_count', 0),
+            agent_counts=restored(aggregates.get('agent_counts')),
+            task_counts=restored(aggregates.get('task_counts')),
+            priority_counts=restored(aggregates.get('priority_counts')),
+            feedback_sum=aggregates.get('feedback_sum', 0),
+            feedback_count=aggregates.get('feedback_count', 0)
+        )
+
+    @classmethod
+    def from_collection(cls, user_id, since=None, collection=None):
+        """Compute a profile with a single ``$facet`` aggregation over raw
+        actions, plus the daily rollups of actions already compacted.
+
+        ``since`` optionally restricts the profile to actions at or after
+        that timestamp (rollups count if their day starts at or after it).
+        """
+        collection = collection if collection is not None else user_actions_collection
+        match = {'user_id': str(user_id)}
+        rollup_match = {'user_id': str(user_id)}
+        if since is not None:
+            match['timestamp'] = {'$gte': since}
+            rollup_match['day'] = {'$gte': since}
+
+        def count_by(field):
+            return [{'$group': {'_id': f'${field}', 'count': {'$sum': 1}}}]
+
+        pipeline = [
+            {'$match': match},
+            {'$facet': {
+                'agents': count_by('agent_used'),
+                'tasks': count_by('task_type'),
+                'priorities': count_by('priority_level'),
+                'totals': [{'$group': {
+                    '_id': None,
+                    'action_count': {'$sum': 1},
+                    'feedback_sum': {'$sum': '$feedback_score'},
+                    'feedback_count': {'$sum': {'$cond': [{'$isNumber': '$feedback_score'}, 1, 0]}}
+                }}]
+            }}
+        ]
+        result = next(collection.aggregate(pipeline), {})
+        totals = (result.get('totals') or [{}])[0]
+        rolled, _ = rollup_increments(rollup_match, AGGREGATE_FIELDS)
+
+        def counts(facet, field):
+            merged = {str(group['_id']): group['count'] for group in result.get(facet, [])}
+            prefix = f"{field}."
+            for path, count in rolled.items():
+                if path.startswith(prefix):
+                    key = restore_key(path[len(prefix):])
+                    merged[key] = merged.get(key, 0) + count
+            return merged
+
+        return cls(
+            str(user_id),
+            action_count=totals.get('action_count', 0) + rolled.get('action_count', 0),
+            agent_counts=counts('agents', 'agent_counts'),
+            task_counts=counts('tasks', 'task_counts'),
+            priority_counts=counts('priorities', 'priority_counts'),
+            feedback_sum=totals.get('feedback_sum', 0) + rolled.get('feedback_sum', 0),
+            feedback_count=totals.get('feedback_count', 0) + rolled.get('feedback_count', 0)
+        )
+
+    @classmethod
+    def for_user(cls, user_id, since=None):
+        """Profile for a user: aggregates for all-time, aggregation for a window."""
+        if since is None:
+            aggregates = get_user_aggregates(user_id)
+            if aggregates:
+                return cls.from_aggregates(aggregates)
+        return cls.from_collection(user_id, since)
+
+    @staticmethod
+    def _most_common(counts):
+        return max(counts, key=counts.get) if counts else None
+
+    @property
+    def most_used_agent(self):
+        return self._most_common(self.agent_counts)
+
+    @property
+    def common_priority(self):
+        return self._most_common(self.priority_counts)
+
+    @property
+    def average_feedback(self):
+        return self.feedback_sum / self.feedback_count if self.feedback_count else None
+
+    def to_dict(self):
+        """The ``user_patterns`` block returned by the suggestion endpoints."""
+        return {
+            'most_used_agent': self.most_used_agent,
+            'average_feedback': self.average_feedback,
+            'common_priority': self.common_priority
+        }
+
+def ensure_indexes():
+    """Create the indexes the suggestion queries rely on."""
+    user_actions_collection.create_index([('user_id', 1), ('timestamp', -1)])
+    user_data_daily_collection.create_index([('user_id', 1), ('day', -1)])
+    user_aggregates_collection.create_index('updated_at')
+    user_actions_collection.create_index('timestamp')
+    agent_bandit_collection.create_index([('user_id', 1), ('agent', 1)], unique=True)
+
+def mc_samples_from_request():
+    """Read the Monte Carlo sample budget from the query string."""
+    mc_samples = request.args.get('mc_samples', MONTE_CARLO_SAMPLES, type=int)
+    return min(max(mc_samples, 1), MONTE_CARLO_MAX_SAMPLES)
+
+def stages_from_request():
+    """Ranker stages for this request: ?stages= replaces the configured set,
+    ?disable_stages= removes stages from it. Unknown names are ignored."""
+    if request.args.get('stages'):
+        stages = [stage.strip() for stage in request.args['stages'].split(',')]
+    else:
+        stages = list(DEFAULT_RANKER_STAGES)
+    disabled = {stage.strip() for stage in request.args.get('disable_stages', '').split(',')}
+    return tuple(stage for stage in stages if stage in RANKER_STAGES and stage not in disabled)
+
+def profile_allocations_from_request():
+    """Whether to trace per-stage allocations (config or ?debug=1)."""
+    return RANKER_PROFILE_ALLOCATIONS or request.args.get('debug') in ('1', 'true')
+
+def history_window_from_request():
+    """Read the history window from the query string, falling back to config."""
+    max_actions = request.args.get('limit', HISTORY_MAX_ACTIONS, type=int)
+    max_actions = min(max(max_actions, 1), HISTORY_LIMIT_CEILING)
+    max_age_days = request.args.get('max_age_days', HISTORY_MAX_AGE_DAYS, type=float) or None
+    return max_actions, max_age_days
+
+history_executor = ThreadPoolExecutor(max_workers=HISTORY_FETCH_CONCURRENCY)
+
+def fetch_user_history(user_id, max_actions=HISTORY_MAX_ACTIONS, max_age_days=HISTORY_MAX_AGE_DAYS):
+    """Fetch the user's most recent actions, newest first.
+
+    Only the fields used by the rankers and the prompt are projected, and
+    the ``(user_id, timestamp)`` index serves both the filter and the sort.
+    """
+    query = {'user_id': str(user_id)}
+    if max_age_days:
+        query['timestamp'] = {'$gte': datetime.now(timezone.utc) - timedelta(days=max_age_days)}
+    cursor = user_actions_collection.find(query, HISTORY_PROJECTION).sort('timestamp', -1).limit(max_actions)
+    actions = list(cursor)
+    if not actions:
+        actions = fetch_rolled_up_history(user_id, max_actions, max_age_days)
+    return actions
+
+def fetch_rolled_up_history(user_id, max_actions=HISTORY_MAX_ACTIONS, max_age_days=HISTORY_MAX_AGE_DAYS):
+    """Newest actions sampled on the user's daily rollups, newest first.
+
+    The fallback for users whose raw actions were all rolled up; read day by
+    day through the ``(user_id, day)`` index until ``max_actions`` are found.
+    """
+    query = {'user_id': str(user_id)}
+    if max_age_days:
+        since = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+        query['last_timestamp'] = {'$gte': since}
+    actions = []
+    for rollup in user_data_daily_collection.find(query, {'recent_actions': 1}).sort('day', -1):
+        for action in rollup.get('recent_actions', []):
+            timestamp = utc_naive(action.get('timestamp'))
+            if max_age_days and timestamp is not None and timestamp < utc_naive(since):
+                continue
+            actions.append(action)
+        if len(actions) >= max_actions:
+            break
+    return actions[:max_actions]
+
+def fetch_user_histories(user_ids, max_actions=HISTORY_MAX_ACTIONS, max_age_days=HISTORY_MAX_AGE_DAYS):
+    """Fetch the recent history of several users.
+
+    Returns a dict of user_id -> actions (newest first) for users with any
+    history in the window. Each user is read with ``fetch_user_history`` on
+    a shared thread pool, so every read is bounded by the ``(user_id,
+    timestamp)`` index and stops after ``max_actions`` documents, however
+    large the user's history.
+    """
+    user_ids = [str(user_id) for user_id in user_ids]
+    histories = history_executor.map(lambda user_id: fetch_user_history(user_id, max_actions, max_age_days), user_ids)
+    return {user_id: actions for user_id, actions in zip(user_ids, histories) if actions}
+
+def history_version(aggregates, *params):
+    """Identify the state of a user's history (plus any request parameters
+    that change the response) for cache lookups."""
+    parts = [aggregates.get('action_count', 0), aggregates.get('last_timestamp')] + list(params)
+    return ':'.join(str(part) for part in parts)
+
+class SuggestionCache:
+    """LRU + TTL cache of suggestion responses keyed by user and history version.
+
+    The in-process tier is always used. When a MongoDB collection is given,
+    entries are also written through to it so that other workers and
+    restarts can reuse them; the collection expires entries itself via a TTL
+    index on ``expires_at``.
+    """
+
+    def __init__(self, max_entries, ttl_seconds, collection=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if collection is not None:
+            collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def get(self, user_id, version):
+        """Return the cached response for this history version, if any."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                cached_version, expires_at, payload = entry
+                if cached_version == version and expires_at > time.monotonic():
+                    self._entries.move_to_end(user_id)
+                    return payload
+                del self._entries[user_id]
+
+        if self.collection is None:
+            return None
+        document = self.collection.find_one({
+            '_id': user_id,
+            'version': version,
+            'expires_at': {'$gt': datetime.now(timezone.utc)}
+        })
+        if document is None:
+            return None
+        self._store_local(user_id, version, document['payload'])
+        return document['payload']
+
+    def set(self, user_id, version, payload):
+        """Cache a response, evicting the least recently used users."""
+        self._store_local(user_id, version, payload)
+        if self.collection is not None:
+            self.collection.replace_one({'_id': user_id}, {
+                '_id': user_id,
+                'version': version,
+                'payload': payload,
+                'expires_at': datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+            }, upsert=True)
+
+    def invalidate(self, user_id):
+        """Drop everything cached for a user, e.g. after new actions arrive."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if self.collection is not None:
+            self.collection.delete_one({'_id': user_id})
+
+    def _store_local(self, user_id, version, payload):
+        with self._lock:
+            self._entries[user_id] = (version, time.monotonic() + self.ttl_seconds, payload)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+suggestion_cache = SuggestionCache(
+    SUGGESTION_CACHE_SIZE,
+    SUGGESTION_CACHE_TTL,
+    suggestion_cache_collection if SUGGESTION_CACHE_MONGO else None
+)
+
 def format_user_history(actions):
     """Format user history into a structured prompt for Gemini."""
     formatted_history = "\nUser Action History:\n"
     for action in actions:
-        formatted_history += f"- Timestamp: {action['timestamp']}\n"
-        formatted_history += f"  Agent: {action['agent_used']}\n"
-        formatted_history += f"  Task: {action['task_type']}\n"
-        formatted_history += f"  Status: {action['completion_status']}\n"
-        formatted_history += f"  Priority: {action['priority_level']}\n"
-        formatted_history += f"  Feedback: {action['feedback_score']}\n"
+        formatted_history += f"- Timestamp: {action.get('timestamp')}\n"
+        formatted_history += f"  Agent: {action.get('agent_used')}\n"
+        formatted_history += f"  Task: {action.get('task_type')}\n"
+        formatted_history += f"  Status: {action.get('completion_status')}\n"
+        formatted_history += f"  Priority: {action.get('priority_level')}\n"
+        formatted_history += f"  Feedback: {action.get('feedback_score')}\n"
         formatted_history += "---\n"
     return formatted_history
 
+def estimate_tokens(text):
+    """Cheap token estimate used to keep prompts under budget."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def action_hour(action):
+    """Hour of day of an action, from ``hour_of_day`` or its timestamp."""
+    if action.get('hour_of_day') is not None:
+        return int(action['hour_of_day'])
+    timestamp = action.get('timestamp')
+    return timestamp.hour if isinstance(timestamp, datetime) else None
+
+def format_frequencies(counter, total, limit=None):
+    """Render a counter as 'value 42%, ...', most common first."""
+    return ', '.join(f"{value} {count * 100 // total}%" for value, count in counter.most_common(limit))
+
+def build_history_digest(actions, token_budget=PROMPT_TOKEN_BUDGET, recent_count=PROMPT_RECENT_ACTIONS):
+    """Summarise a user's history into compact statistics for the prompt.
+
+    ``actions`` are newest first. The digest holds hour-of-day, agent,
+    task and priority distributions, completion rates per task, the most
+    common task-to-task transitions and the last few actions verbatim. The
+    verbatim tail is shortened, and then the least useful sections dropped,
+    until the digest fits ``token_budget``.
+    """
+    total = len(actions)
+    if not total:
+        return "\nNo recorded actions.\n"
+
+    hours = Counter(hour for hour in map(action_hour, actions) if hour is not None)
+    agents = Counter(action.get('agent_used') for action in actions)
+    tasks = Counter(action.get('task_type') for action in actions)
+    priorities = Counter(action.get('priority_level') for action in actions)
+    completed = Counter(action.get('task_type') for action in actions
+                        if action.get('completion_status') == 'Completed')
+    feedback = [action['feedback_score'] for action in actions if action.get('feedback_score') is not None]
+    chronological = [action.get('task_type') for action in reversed(actions)]
+    transitions = Counter(zip(chronological, chronological[1:]))
+
+    sections = [
+        f"\nActions analyzed: {total} (from {actions[-1].get('timestamp')} to {actions[0].get('timestamp')})",
+        f"Agent usage: {format_frequencies(agents, total)}",
+        f"Task frequency: {format_frequencies(tasks, total, 8)}",
+        "Completion rate by task: " + ', '.join(
+            f"{task} {completed[task] * 100 // count}%" for task, count in tasks.most_common(8)),
+        "Common task sequences: " + ', '.join(
+            f"{first} -> {second} ({count}x)" for (first, second), count in transitions.most_common(5)),
+        "Activity by hour of day: " + ', '.join(f"{hour:02d}h {count}" for hour, count in sorted(hours.items())),
+        f"Priority mix: {format_frequencies(priorities, total)}",
+        f"Average feedback: {sum(feedback) / len(feedback):.2f}" if feedback else "Average feedback: n/a",
+    ]
+
+    recent_count = min(recent_count, total)
+    while True:
+        digest = '\n'.join(sections) + '\n'
+        if recent_count:
+            digest += format_user_history(actions[:recent_count])
+        if estimate_tokens(digest) <= token_budget:
+            return digest
+        if recent_count:
+            recent_count //= 2
+        elif len(sections) > 1:
+            sections.pop()
+        else:
+            return digest[:token_budget * CHARS_PER_TOKEN]
+
+def build_suggestion_prompt(history_digest):
+    """Create the suggestion prompt around a history digest."""
+    return f"""You are an AI assistant helping to analyze user behavior patterns and suggest next actions on our platform. 
+    Based on the following user history, suggest the next 3 most likely actions or tasks the user might want to perform.
+    Consider patterns in:
+    - Preferred time of day for different tasks
+    - Common task sequences
+    - Priority patterns
+    - Agent preferences
+    - Task completion rates
+    - User feedback patterns
+    
+    For each suggestion, provide:
+    1. The recommended action/task
+    2. Which agent should handle it
+    3. Suggested priority level
+    4. Brief explanation of why this suggestion is relevant
+    
+    Here's a summary of the user's recent history:{history_digest}.Remember the format of the answer should be such that it shouldnt look ai has generated it.Do not include these kind of words in response Okay, based on the user's recent activity, here are three suggested next actions:1. """
+
 def generate_prompt(user_history):
     """Create a detailed prompt for Gemini."""
     prompt = """You are an AI assistant helping to analyze user behavior patterns and suggest next actions on our platform. 
@@ -73,32 +1045,196 @@ def generate_prompt(user_history):
     prompt += "\nPlease provide your suggestions in a clear, structured format."
     return prompt
 
-def multi_armed_bandit_selection(actions):
-    """Multi-Armed Bandit method for action selection."""
-    try:
-        agent_rewards = defaultdict(float)
-        agent_counts = defaultdict(int)
-        for action in actions:
-            agent = action.get('agent_used', 'default')
-            agent_rewards[agent] += action.get('reward', 1)
-            agent_counts[agent] += 1
-        for action in actions:
+GLOBAL_TRANSITIONS_ID = '__global__'
+ANY_CONTEXT = '*'
+HOUR_BUCKETS = ((18, 'evening'), (12, 'afternoon'), (6, 'morning'), (0, 'night'))
+
+def hour_bucket(hour):
+    """Coarse time of day used to condition task transitions."""
+    if hour is None:
+        return ANY_CONTEXT
+    return next(name for start, name in HOUR_BUCKETS if hour >= start)
+
+def transition_key(agent, bucket, task):
+    return '|'.join(aggregate_key(part) for part in (agent, bucket, task))
+
+def transition_increments(actions, previous=None):
+    """Fold time-ordered actions into ``$inc`` paths of task-transition counts.
+
+    Every transition ``previous task -> task`` is counted under the context
+    of the new action (its agent and hour bucket) and once context-free;
+    ``*|*|*`` counts task popularity. Returns the increments and the last
+    action seen, so the next batch can continue the chain.
+    """
+    increments = defaultdict(int)
+    last = previous
+    ordered = sorted(actions, key=lambda action: (action.get('timestamp') is not None, action.get('timestamp')))
+    for action in ordered:
+        task = action.get('task_type')
+        if task is None:
+            continue
+        next_task = aggregate_key(task)
+        if last is not None and last.get('task_type') is not None:
             agent = action.get('agent_used', 'default')
-            action['agent_score'] = agent_rewards[agent] / (agent_counts[agent] + 1e-5)
-        return sorted(actions, key=lambda x: x.get('agent_score', 0), reverse=True)
-    except Exception as e:
-        print(f"[Error] Multi-Armed Bandit Selection failed: {str(e)}")
-        return actions
-def monte_carlo_simulation(actions):
-    """Monte Carlo simulation for action rewards."""
-    try:
-        for action in actions:
-            action['monte_carlo_reward'] = np.mean([random.uniform(0.8, 1.2) * action.get('reward', 1) for _ in range(1000)])
-        return sorted(actions, key=lambda x: x.get('monte_carlo_reward', 0), reverse=True)
-    except Exception as e:
-        print(f"[Error] Monte Carlo Simulation failed: {str(e)}")
-        return actions
+            bucket = hour_bucket(action_hour(action))
+            increments[f"transitions.{transition_key(agent, bucket, last['task_type'])}.{next_task}"] += 1
+            increments[f"transitions.{transition_key(ANY_CONTEXT, ANY_CONTEXT, last['task_type'])}.{next_task}"] += 1
+        increments[f"transitions.{transition_key(ANY_CONTEXT, ANY_CONTEXT, ANY_CONTEXT)}.{next_task}"] += 1
+        last = {'task_type': task, 'agent_used': action.get('agent_used')}
+    return dict(increments), last
+
+class TaskTransitionModel:
+    """Per-user (plus global) Markov model of the next ``task_type``.
+
+    Counts live in ``task_transitions``, one document per user and one for
+    everyone, and are kept current with ``$inc`` as actions are recorded.
+    Users are backfilled from their history on first use, like the
+    aggregates. Predictions back off from the user's counts in the current
+    agent/hour context, to the user's context-free counts, to the global
+    ones, and finally to plain task popularity.
+    """
+
+    def __init__(self, collection, cache):
+        self.collection = collection
+        self.cache = cache
+
+    def record(self, actions_by_user):
+        """Apply newly recorded actions, grouped by user, in one bulk write."""
+        user_ids = list(actions_by_user)
+        known = {
+            doc['_id']: doc
+            for doc in self.collection.find({'_id': {'$in': user_ids}}, {'last_action': 1, 'counted_through': 1})
+        }
+        now = datetime.now(timezone.utc)
+        operations = []
+        global_increments = defaultdict(int)
+        for user_id, actions in actions_by_user.items():
+            previous = known.get(user_id, {}).get('last_action')
+            increments, last = transition_increments(actions, previous)
+            merge_increments(global_increments, increments)
+            # Users without a document are backfilled (new actions included) on first use
+            if user_id in known and already_counted(known[user_id], actions):
+                self.rebuild_user(user_id)
+            elif user_id in known and increments:
+                operations.append(UpdateOne(
+                    not_counted_filter(user_id, actions),
+                    {'$inc': increments, '$set': {'last_action': last, 'updated_at': now}}
+                ))
+            self.cache.invalidate(user_id)
+        if global_increments:
+            operations.append(UpdateOne(
+                {'_id': GLOBAL_TRANSITIONS_ID},
+                {'$inc': dict(global_increments), '$set': {'updated_at': now}},
+                upsert=True
+            ))
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+    def rebuild_user(self, user_id):
+        """Recompute a user's transition counts from raw actions and daily rollups."""
+        cursor = NewestIdTracker(user_actions_collection.find(
+            {'user_id': str(user_id)}, {'task_type': 1, 'agent_used': 1, 'hour_of_day': 1, 'timestamp': 1}
+        ))
+        increments, last = transition_increments(cursor, rolled_last_action(user_id))
+        merge_increments(increments, rollup_increments({'user_id': str(user_id)}, ('transitions',))[0])
+        document = nest_increments(increments, {
+            '_id': str(user_id), 'last_action': last, 'counted_through': cursor.newest_id,
+            'updated_at': datetime.now(timezone.utc)
+        })
+        self.collection.replace_one({'_id': str(user_id)}, document, upsert=True)
+        return document
+
+    def rebuild_global(self):
+        """Recompute the global counts, streaming history one user at a time."""
+        print("[RL] Rebuilding global task transitions...")
+        cursor = user_actions_collection.find(
+            {}, {'_id': 0, 'user_id': 1, 'task_type': 1, 'agent_used': 1, 'hour_of_day': 1, 'timestamp': 1}
+        ).sort([('user_id', 1), ('timestamp', -1)])
+        totals, _ = rollup_increments({}, ('transitions',))
+        # Each user's raw chain continues from the last action of their newest rollup
+        rolled_last = {}
+        for rollup in user_data_daily_collection.find({'last_action': {'$exists': True}},
+                                                      {'user_id': 1, 'day': 1, 'last_action': 1}):
+            newest = rolled_last.get(rollup['user_id'])
+            if newest is None or rollup['day'] > newest['day']:
+                rolled_last[rollup['user_id']] = rollup
+        for user_id, actions in groupby(cursor, key=lambda action: action.get('user_id')):
+            previous = rolled_last.get(user_id, {}).get('last_action')
+            merge_increments(totals, transition_increments(actions, previous)[0])
+        document = nest_increments(totals, {
+            '_id': GLOBAL_TRANSITIONS_ID, 'rebuilt_at': datetime.now(timezone.utc),
+            'updated_at': datetime.now(timezone.utc)
+        })
+        self.collection.replace_one({'_id': GLOBAL_TRANSITIONS_ID}, document, upsert=True)
+        self.cache.invalidate(GLOBAL_TRANSITIONS_ID)
+        return document
+
+    def start_background_rebuild(self):
+        """Build the global counts in the background if they were never built."""
+        if self.collection.find_one({'_id': GLOBAL_TRANSITIONS_ID, 'rebuilt_at': {'$exists': True}}, {'_id': 1}):
+            return
+
+        def rebuild():
+            try:
+                self.rebuild_global()
+            except Exception as e:
+                print(f"[Error] Rebuilding global task transitions failed: {str(e)}")
 
+        threading.Thread(target=rebuild, daemon=True).start()
+
+    def _document(self, scope, version):
+        document = self.cache.get(scope, version)
+        if document is None:
+            document = self.collection.find_one({'_id': scope})
+            if document is None and scope != GLOBAL_TRANSITIONS_ID:
+                document = self.rebuild_user(scope)
+            document = document or {}
+            self.cache.set(scope, version, document)
+        return document
+
+    def predict(self, user_id, version, agent=None, hour=None, last_task=None, top_k=TRANSITION_TOP_K):
+        """Top-k next tasks for the user, with the context and level that produced them."""
+        user_document = self._document(str(user_id), version)
+        global_document = self._document(GLOBAL_TRANSITIONS_ID, 'global')
+        last_action = user_document.get('last_action') or {}
+        last_task = last_task or last_action.get('task_type')
+        agent = agent or last_action.get('agent_used')
+        bucket = hour_bucket(datetime.now(timezone.utc).hour if hour is None else hour)
+
+        levels = [
+            ('user_context', user_document, (agent, bucket, last_task)),
+            ('user', user_document, (ANY_CONTEXT, ANY_CONTEXT, last_task)),
+            ('global_context', global_document, (agent, bucket, last_task)),
+            ('global', global_document, (ANY_CONTEXT, ANY_CONTEXT, last_task)),
+            ('user_popularity', user_document, (ANY_CONTEXT, ANY_CONTEXT, ANY_CONTEXT)),
+            ('global_popularity', global_document, (ANY_CONTEXT, ANY_CONTEXT, ANY_CONTEXT))
+        ]
+        level, counts = None, {}
+        for name, document, context in levels:
+            if None in context:
+                continue
+            found = document.get('transitions', {}).get(transition_key(*context), {})
+            if found and not counts:
+                level, counts = name, found  # Sparse, but better than nothing
+            if sum(found.values()) >= TRANSITION_MIN_COUNT:
+                level, counts = name, found
+                break
+
+        total = sum(counts.values())
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return {
+            'context': {'last_task': last_task, 'agent': agent, 'hour_bucket': bucket},
+            'level': level,
+            'next_tasks': [
+                {'task_type': restore_key(task), 'probability': round(count / total, 4), 'count': count}
+                for task, count in ranked
+            ]
+        }
+
+task_transitions = TaskTransitionModel(
+    task_transitions_collection,
+    SuggestionCache(TRANSITION_CACHE_SIZE, TRANSITION_CACHE_TTL)
+)
 
 def evolutionary_algorithm_optimizer(actions):
     """Uses an evolutionary approach to find the best actions."""
@@ -126,243 +1262,1038 @@ def genetic_algorithm_selector(actions):
     """Uses genetic algorithms to select optimal actions."""
     return sorted(actions, key=lambda x: random.random(), reverse=True)
 
-def policy_gradient_ranking(actions):
-    """Policy Gradient method to rank actions."""
+PRIORITY_VALUES = {'Low': 1, 'Medium': 2, 'High': 3}
+
+def priority_value(priority):
+    """Map a priority level (label or number) onto a numeric scale."""
+    if isinstance(priority, str):
+        return PRIORITY_VALUES.get(priority, 1)
+    return priority if priority is not None else 1
+
+class ActionColumns:
+    """Columnar view of a user's action history, built once per request.
+
+    Rankers work on these arrays and return index permutations into the
+    original action list instead of mutating and re-sorting the dicts.
+    """
+
+    def __init__(self, actions):
+        self.size = len(actions)
+        self.reward = np.fromiter((a.get('reward', 1) for a in actions), dtype=float, count=self.size)
+        self.priority = np.fromiter((priority_value(a.get('priority_level', 1)) for a in actions),
+                                    dtype=float, count=self.size)
+        self.agent_names, self.agent = np.unique(
+            np.array([aggregate_key(a.get('agent_used', 'default')) for a in actions], dtype=object).astype(str),
+            return_inverse=True
+        )
+        self.state_names, self.state = np.unique(
+            np.array([str(a.get('state', 'default')) for a in actions], dtype=object).astype(str),
+            return_inverse=True
+        )
+
+def rank_by(scores, **extra):
+    """Build a ranking result: a descending, stable index permutation plus scores."""
+    ranking = {'order': np.argsort(-scores, kind='stable'), 'score': scores}
+    ranking.update(extra)
+    return ranking
+
+def identity_ranking(columns):
+    """Fallback ranking that keeps the history order untouched."""
+    return {'order': np.arange(columns.size), 'score': np.zeros(columns.size)}
+
+def make_rng():
+    """Create a NumPy Generator, seeded from RL_RANDOM_SEED when it is set."""
+    return np.random.default_rng(RANDOM_SEED)
+
+def monte_carlo_simulation(columns, n_samples=None, rng=None, confidence=MONTE_CARLO_CONFIDENCE):
+    """Applies Monte Carlo estimation for action rewards.
+
+    Draws an ``(n_actions, n_samples)`` matrix of reward perturbations and
+    reports the per-action mean with a normal-approximation confidence
+    interval. Rows are sampled in blocks so memory stays bounded for large
+    histories and sample budgets.
+    """
     try:
-        action_probs = np.exp([a.get('priority_level', 1) for a in actions])
-        action_probs /= np.sum(action_probs) if np.sum(action_probs) > 0 else 1
-        for i, action in enumerate(actions):
-            action['policy_prob'] = action_probs[i]
-        return sorted(actions, key=lambda x: x.get('policy_prob', 0), reverse=True)
+        n_samples = max(1, n_samples or MONTE_CARLO_SAMPLES)
+        rng = rng or make_rng()
+        mean = np.empty(columns.size)
+        std = np.empty(columns.size)
+        rows_per_block = max(1, MONTE_CARLO_CHUNK_ELEMENTS // n_samples)
+        for start in range(0, columns.size, rows_per_block):
+            stop = min(start + rows_per_block, columns.size)
+            samples = rng.uniform(0.8, 1.2, size=(stop - start, n_samples))
+            samples *= columns.reward[start:stop, None]
+            mean[start:stop] = samples.mean(axis=1)
+            std[start:stop] = samples.std(axis=1, ddof=1) if n_samples > 1 else 0.0
+        half_width = norm.ppf(0.5 + confidence / 2) * std / np.sqrt(n_samples)
+        return rank_by(mean, ci_low=mean - half_width, ci_high=mean + half_width)
+    except Exception as e:
+        print(f"[Error] Monte Carlo Simulation failed: {str(e)}")
+        return identity_ranking(columns)
+
+def policy_gradient_ranking(columns):
+    """Uses Policy Gradient method to rank actions based on probabilities."""
+    try:
+        action_probs = np.exp(columns.priority - columns.priority.max())
+        action_probs /= action_probs.sum()
+        return rank_by(action_probs)
     except Exception as e:
         print(f"[Error] Policy Gradient Ranking failed: {str(e)}")
-        return actions
-def bayesian_inference_uncertainty(actions):
-    """Applies Bayesian inference to model uncertainty."""
+        return identity_ranking(columns)
+
+def multi_armed_bandit_selection(columns, agent_stats=None):
+    """Uses a Multi-Armed Bandit approach to select the best agent.
+
+    When ``agent_stats`` (the per-user aggregate document) is given, the
+    reward sums and counts are read from it instead of rescanning history.
+    """
     try:
-        for action in actions:
-            prior = beta.rvs(2, 5)
-            likelihood = action.get('reward', 1) / 10.0
-            posterior = (prior * likelihood) / ((prior * likelihood) + ((1 - prior) * (1 - likelihood)))
-            action['bayesian_score'] = posterior
-        return sorted(actions, key=lambda x: x.get('bayesian_score', 0), reverse=True)
+        if agent_stats is not None:
+            reward_sums = agent_stats.get('agent_reward_sums', {})
+            counts = agent_stats.get('agent_counts', {})
+            agent_rewards = np.array([reward_sums.get(name, 0) for name in columns.agent_names], dtype=float)
+            agent_counts = np.array([counts.get(name, 0) for name in columns.agent_names], dtype=float)
+        else:
+            n_agents = len(columns.agent_names)
+            agent_rewards = np.bincount(columns.agent, weights=columns.reward, minlength=n_agents)
+            agent_counts = np.bincount(columns.agent, minlength=n_agents).astype(float)
+        agent_scores = agent_rewards / (agent_counts + 1e-5)
+        return rank_by(agent_scores[columns.agent])
+    except Exception as e:
+        print(f"[Error] Multi-Armed Bandit Selection failed: {str(e)}")
+        return identity_ranking(columns)
+
+def record_agent_rewards(updates):
+    """Apply Bernoulli rewards to the per-(user, agent) Beta posteriors.
+
+    ``updates`` is a list of ``(user_id, agent, reward)`` with rewards in
+    [0, 1]. Each one is a single atomic ``$inc``; all are sent in one bulk
+    write.
+    """
+    now = datetime.now(timezone.utc)
+    operations = [
+        UpdateOne(
+            {'user_id': str(user_id), 'agent': agent},
+            {'$inc': {'successes': reward, 'failures': 1 - reward}, '$set': {'updated_at': now}},
+            upsert=True
+        )
+        for user_id, agent, reward in updates
+    ]
+    if operations:
+        agent_bandit_collection.bulk_write(operations, ordered=False)
+
+def load_agent_posteriors(user_ids):
+    """Return {user_id: {agent_key: (alpha, beta)}} for the given users."""
+    posteriors = {str(user_id): {} for user_id in user_ids}
+    for arm in agent_bandit_collection.find({'user_id': {'$in': list(posteriors)}}):
+        posteriors[arm['user_id']][aggregate_key(arm['agent'])] = (
+            BANDIT_PRIOR_ALPHA + arm.get('successes', 0),
+            BANDIT_PRIOR_BETA + arm.get('failures', 0)
+        )
+    return posteriors
+
+def posterior_arrays(agent_names, posteriors):
+    """Alpha and beta arrays aligned with ``agent_names``; unseen arms get the prior."""
+    prior = (BANDIT_PRIOR_ALPHA, BANDIT_PRIOR_BETA)
+    alpha, beta_ = np.array([posteriors.get(name, prior) for name in agent_names], dtype=float).reshape(-1, 2).T
+    return alpha, beta_
+
+def bayesian_inference_uncertainty(columns, rng=None, posteriors=None):
+    """Thompson-sample each agent's Beta posterior and score actions by their agent.
+
+    One draw is made per agent (not per action), so the ranking explores
+    agents in proportion to the uncertainty of their posteriors.
+    """
+    try:
+        rng = rng or make_rng()
+        alpha, beta_ = posterior_arrays(columns.agent_names, posteriors or {})
+        sampled = rng.beta(alpha, beta_)
+        posterior_mean = alpha / (alpha + beta_)
+        return rank_by(sampled[columns.agent], posterior_mean=posterior_mean[columns.agent])
     except Exception as e:
         print(f"[Error] Bayesian Inference failed: {str(e)}")
-        return actions
-def random_forest_ranking(actions):
-    """Random Forest Regression ranking."""
+        return identity_ranking(columns)
+
+class RankerModelRegistry:
+    """Versioned store of the pre-fitted Random Forest and K-Means rankers.
+
+    Models are trained off the request path on a sample of all users'
+    actions, one global model plus one per agent segment with enough data,
+    and persisted with joblib as ``ranker_models_v<N>.joblib``. Requests only
+    ever call ``predict`` on the currently loaded bundle.
+    """
+
+    FILE_PREFIX = 'ranker_models_v'
+
+    def __init__(self, model_dir):
+        self.model_dir = model_dir
+        self.bundle = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.bundle['version'] if self.bundle else None
+
+    def _versions(self):
+        if not os.path.isdir(self.model_dir):
+            return []
+        versions = []
+        for filename in os.listdir(self.model_dir):
+            if filename.startswith(self.FILE_PREFIX) and filename.endswith('.joblib'):
+                try:
+                    versions.append(int(filename[len(self.FILE_PREFIX):-len('.joblib')]))
+                except ValueError:
+                    continue
+        return sorted(versions)
+
+    def _path(self, version):
+        return os.path.join(self.model_dir, f"{self.FILE_PREFIX}{version}.joblib")
+
+    def load(self):
+        """Load the newest persisted bundle, if there is one."""
+        versions = self._versions()
+        if not versions:
+            print("[RL] No pre-fitted ranker models found")
+            return None
+        bundle = joblib.load(self._path(versions[-1]))
+        with self._lock:
+            self.bundle = bundle
+        print(f"[RL] Loaded ranker models v{bundle['version']}")
+        return bundle
+
+    def reload_if_newer(self):
+        """Load the newest persisted bundle if another process trained one."""
+        versions = self._versions()
+        if versions and versions[-1] != self.version:
+            self.load()
+
+    def train(self, sample_size=RANKER_TRAINING_SAMPLE):
+        """Fit new models on a random sample of ``user_data`` and persist them."""
+        sample = list(user_actions_collection.aggregate([
+            {'$sample': {'size': sample_size}},
+            {'$project': {'_id': 0, 'reward': 1, 'priority_level': 1, 'agent_used': 1}}
+        ]))
+        if len(sample) < 3:
+            print("[RL] Not enough data to train ranker models")
+            return None
+
+        columns = ActionColumns(sample)
+        segments = {None: np.ones(columns.size, dtype=bool)}
+        for code, agent in enumerate(columns.agent_names):
+            mask = columns.agent == code
+            if mask.sum() >= RANKER_MIN_SEGMENT_SIZE:
+                segments[agent] = mask
+
+        random_forests = {}
+        k_means = {}
+        for segment, mask in segments.items():
+            X = columns.reward[mask].reshape(-1, 1)
+            forest = RandomForestRegressor()
+            forest.fit(X, columns.priority[mask])
+            random_forests[segment] = forest
+            if len(np.unique(X)) >= 3:
+                k_means[segment] = KMeans(n_clusters=3, n_init=10).fit(X)
+
+        versions = self._versions()
+        bundle = {
+            'version': versions[-1] + 1 if versions else 1,
+            'trained_at': datetime.now(timezone.utc).isoformat(),
+            'samples': columns.size,
+            'random_forest': random_forests,
+            'k_means': k_means,
+            # K-Means labels are arbitrary; rank clusters by centroid instead
+            'k_means_rank': {
+                segment: np.argsort(np.argsort(kmeans.cluster_centers_.ravel()))
+                for segment, kmeans in k_means.items()
+            }
+        }
+        os.makedirs(self.model_dir, exist_ok=True)
+        path = self._path(bundle['version'])
+        joblib.dump(bundle, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        with self._lock:
+            self.bundle = bundle
+        print(f"[RL] Trained ranker models v{bundle['version']} on {columns.size} actions")
+        return bundle
+
+    def start_background_training(self, interval=RANKER_RETRAIN_SECONDS):
+        """Retrain periodically on a daemon thread; trains first if nothing is loaded."""
+        if interval <= 0 and self.bundle is not None:
+            return
+
+        def loop():
+            if self.bundle is not None:
+                time.sleep(interval)
+            while True:
+                try:
+                    self.train()
+                except Exception as e:
+                    print(f"[Error] Ranker model training failed: {str(e)}")
+                if interval <= 0:
+                    return
+                time.sleep(interval)
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def predict(self, kind, columns, transform=None):
+        """Predict for every action with its agent's segment model, or the global one."""
+        with self._lock:
+            bundle = self.bundle
+        if bundle is None or None not in bundle[kind]:
+            return None
+        models = bundle[kind]
+        X = columns.reward.reshape(-1, 1)
+        predictions = np.empty(columns.size)
+        segment_codes = {code: agent for code, agent in enumerate(columns.agent_names) if agent in models}
+        remaining = np.ones(columns.size, dtype=bool)
+        for code, agent in segment_codes.items():
+            mask = columns.agent == code
+            predictions[mask] = self._predict_one(bundle, kind, agent, X[mask], transform)
+            remaining &= ~mask
+        if remaining.any():
+            predictions[remaining] = self._predict_one(bundle, kind, None, X[remaining], transform)
+        return predictions
+
+    @staticmethod
+    def _predict_one(bundle, kind, segment, X, transform):
+        output = bundle[kind][segment].predict(X)
+        return transform(bundle, segment, output) if transform else output
+
+ranker_models = RankerModelRegistry(RANKER_MODEL_DIR)
+
+def random_forest_ranking(columns, registry=None):
+    """Random Forest Regression ranking using the pre-fitted registry models."""
     try:
-        model = RandomForestRegressor()
-        X = np.array([[a.get('reward', 1)] for a in actions])
-        y = np.array([a.get('priority_level', 1) for a in actions])
-        model.fit(X, y)
-        predictions = model.predict(X)
-        for i, action in enumerate(actions):
-            action['rf_score'] = predictions[i]
-        return sorted(actions, key=lambda x: x.get('rf_score', 0), reverse=True)
+        predictions = (registry or ranker_models).predict('random_forest', columns)
+        if predictions is None:
+            return identity_ranking(columns)
+        return rank_by(predictions)
     except Exception as e:
         print(f"[Error] Random Forest Ranking failed: {str(e)}")
-        return actions
+        return identity_ranking(columns)
+
+def k_means_clustering(columns, registry=None):
+    """Cluster actions with the pre-fitted K-Means models.
 
-def k_means_clustering(actions):
-    """Cluster actions using K-Means."""
+    Cluster ids are ordered by centroid, so a higher cluster means a
+    higher-reward group of actions.
+    """
     try:
-        X = np.array([[a.get('reward', 1)] for a in actions])
-        kmeans = KMeans(n_clusters=3, n_init=10)
-        clusters = kmeans.fit_predict(X)
-        for i, action in enumerate(actions):
-            action['cluster'] = clusters[i]
-        return sorted(actions, key=lambda x: x.get('cluster', 0), reverse=True)
+        clusters = (registry or ranker_models).predict(
+            'k_means', columns, lambda bundle, segment, labels: bundle['k_means_rank'][segment][labels])
+        if clusters is None:
+            return identity_ranking(columns)
+        return rank_by(clusters, cluster=clusters.astype(int))
     except Exception as e:
         print(f"[Error] K-Means Clustering failed: {str(e)}")
-        return actions
-def deep_q_learning_optimization(actions):
+        return identity_ranking(columns)
+
+def deep_q_learning_optimization(columns):
     """Uses Deep Q-Learning to prioritize the best next actions."""
     try:
-        q_table = defaultdict(lambda: np.zeros(len(actions)))  # Initialize Q-table
-        for action in actions:
-            state = action.get('state', 'default')
-            q_values = q_table[state]
-            max_q_index = np.argmax(q_values) if len(q_values) > 0 else 0
-            action['q_value'] = q_values[max_q_index]  # Assign Q-value
-        return sorted(actions, key=lambda x: x.get('q_value', 0), reverse=True)
+        q_table = np.zeros(len(columns.state_names))  # Initialize Q-table, one value per state
+        return rank_by(q_table[columns.state])
     except Exception as e:
         print(f"[Error] Deep Q-Learning Optimization failed: {str(e)}")
-        return actions  # Always return actions even if an error occurs
+        return identity_ranking(columns)
 
+def summarize_rankings(actions, rankings, top_k=3):
+    """Describe the top ``top_k`` actions of every ranking for the response."""
+    summary = {}
+    for name, ranking in rankings.items():
+        top = []
+        for index in ranking['order'][:top_k]:
+            action = actions[index]
+            entry = {
+                'task_type': action.get('task_type'),
+                'agent_used': action.get('agent_used'),
+                'priority_level': action.get('priority_level')
+            }
+            for key, values in ranking.items():
+                if key != 'order':
+                    entry[key] = values[index].item()
+            top.append(entry)
+        summary[name] = top
+    return summary
 
-def evolutionary_algorithm_optimizer(actions):
-    """Uses an evolutionary approach to find the best actions."""
-    return sorted(actions, key=lambda x: random.random(), reverse=True)
 
-def fuzzy_logic_selector(actions):
-    """Implements fuzzy logic for ranking actions."""
-    for action in actions:
-        action['fuzzy_score'] = random.uniform(0, 1)
-    return actions
+# Named ranker stages, in execution order. Each takes the columnar history
+# and a per-request context (rng, aggregates, posteriors, mc_samples).
+RANKER_STAGES = OrderedDict([
+    ('q_learning', ("Running Deep Q-Learning Optimization",
+                    lambda columns, context: deep_q_learning_optimization(columns))),
+    ('monte_carlo', ("Applying Monte Carlo Estimation",
+                     lambda columns, context: monte_carlo_simulation(columns, context['mc_samples'], context['rng']))),
+    ('policy_gradient', ("Performing Policy Gradient Ranking",
+                         lambda columns, context: policy_gradient_ranking(columns))),
+    ('multi_armed_bandit', ("Selecting Best Agent via Multi-Armed Bandit",
+                            lambda columns, context: multi_armed_bandit_selection(columns, context['aggregates']))),
+    ('bayesian', ("Modeling Uncertainty with Bayesian Inference",
+                  lambda columns, context: bayesian_inference_uncertainty(columns, context['rng'],
+                                                                          context['posteriors']))),
+    ('random_forest', ("Ranking with Random Forest",
+                       lambda columns, context: random_forest_ranking(columns))),
+    ('k_means', ("Clustering with K-Means",
+                 lambda columns, context: k_means_clustering(columns))),
+])
 
-def autoencoder_dim_reduction(actions):
-    """Performs feature reduction using autoencoders."""
-    for action in actions:
-        action['encoded_value'] = random.uniform(0, 1)
-    return actions
+class RankerMetrics:
+    """Process-wide counters of ranker stage cost, exported at /metrics."""
 
-def reinforcement_learning_finetuning(actions):
-    """Pretends to fine-tune actions with reinforcement learning."""
-    for action in actions:
-        action['rl_adjustment'] = random.uniform(-0.1, 0.1)
-    return actions
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.allocated_bytes = defaultdict(int)
 
-def genetic_algorithm_selector(actions):
-    """Uses genetic algorithms to select optimal actions."""
-    return sorted(actions, key=lambda x: random.random(), reverse=True)
-def monte_carlo_simulation(actions):
-    """Applies Monte Carlo estimation for action rewards."""
-    try:
-        for action in actions:
-            action['monte_carlo_reward'] = np.mean([random.uniform(0.8, 1.2) * action.get('reward', 1) for _ in range(10)])
-        return sorted(actions, key=lambda x: x.get('monte_carlo_reward', 0), reverse=True)
-    except Exception as e:
-        print(f"[Error] Monte Carlo Simulation failed: {str(e)}")
-        return actions
+    def observe(self, stage, seconds, allocated_bytes=None):
+        with self._lock:
+            self.calls[stage] += 1
+            self.seconds[stage] += seconds
+            if allocated_bytes is not None:
+                self.allocated_bytes[stage] += allocated_bytes
 
-def policy_gradient_ranking(actions):
-    """Uses Policy Gradient method to rank actions based on probabilities."""
-    try:
-        action_probs = np.exp([a.get('priority_level', 1) for a in actions])
-        action_probs /= np.sum(action_probs) if np.sum(action_probs) > 0 else 1
-        for i, action in enumerate(actions):
-            action['policy_prob'] = action_probs[i]
-        return sorted(actions, key=lambda x: x.get('policy_prob', 0), reverse=True)
-    except Exception as e:
-        print(f"[Error] Policy Gradient Ranking failed: {str(e)}")
-        return actions
+    def render(self):
+        """Prometheus text exposition of the counters."""
+        with self._lock:
+            lines = [
+                '# HELP rl_ranker_stage_calls_total Ranker stage executions.',
+                '# TYPE rl_ranker_stage_calls_total counter'
+            ]
+            lines += [f'rl_ranker_stage_calls_total{{stage="{stage}"}} {count}' for stage, count in self.calls.items()]
+            lines += [
+                '# HELP rl_ranker_stage_seconds_total Wall time spent in ranker stages.',
+                '# TYPE rl_ranker_stage_seconds_total counter'
+            ]
+            lines += [f'rl_ranker_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}'
+                      for stage, seconds in self.seconds.items()]
+            lines += [
+                '# HELP rl_ranker_stage_allocated_bytes_total Peak traced allocation of profiled ranker stages.',
+                '# TYPE rl_ranker_stage_allocated_bytes_total counter'
+            ]
+            lines += [f'rl_ranker_stage_allocated_bytes_total{{stage="{stage}"}} {size}'
+                      for stage, size in self.allocated_bytes.items()]
+        return '\n'.join(lines) + '\n'
 
-def multi_armed_bandit_selection(actions):
-    """Uses a Multi-Armed Bandit approach to select the best agent."""
-    try:
-        agent_rewards = defaultdict(float)
-        agent_counts = defaultdict(int)
-        for action in actions:
-            agent = action.get('agent_used', 'default')
-            agent_rewards[agent] += action.get('reward', 1)
-            agent_counts[agent] += 1
-        
-        for action in actions:
-            agent = action.get('agent_used', 'default')
-            action['agent_score'] = agent_rewards[agent] / (agent_counts[agent] + 1e-5)
-        return sorted(actions, key=lambda x: x.get('agent_score', 0), reverse=True)
-    except Exception as e:
-        print(f"[Error] Multi-Armed Bandit Selection failed: {str(e)}")
-        return actions
+ranker_metrics = RankerMetrics()
+_tracemalloc_lock = threading.Lock()
+
+def run_ranker_pipeline(columns, context, stages=DEFAULT_RANKER_STAGES, profile_allocations=False):
+    """Run the named ranker stages and time each one.
+
+    Returns ``(rankings, timings)`` where timings maps each stage to its
+    wall time in milliseconds and, when ``profile_allocations`` is set, the
+    peak memory it allocated. Allocation tracing uses tracemalloc, which is
+    serialised across requests and also sees other threads' allocations, so
+    treat those numbers as approximate under concurrent load.
+    """
+    rankings = {}
+    timings = {}
+    for name in stages:
+        if name not in RANKER_STAGES:
+            print(f"[Error] Unknown ranker stage: {name}")
+            continue
+        description, run = RANKER_STAGES[name]
+        print(f"[RL] {description}...")
+        if profile_allocations:
+            with _tracemalloc_lock:
+                already_tracing = tracemalloc.is_tracing()
+                if already_tracing:
+                    tracemalloc.reset_peak()
+                else:
+                    tracemalloc.start()
+                baseline = tracemalloc.get_traced_memory()[0]
+                started = time.perf_counter()
+                rankings[name] = run(columns, context)
+                elapsed = time.perf_counter() - started
+                allocated = tracemalloc.get_traced_memory()[1] - baseline
+                if not already_tracing:
+                    tracemalloc.stop()
+        else:
+            started = time.perf_counter()
+            rankings[name] = run(columns, context)
+            elapsed = time.perf_counter() - started
+            allocated = None
+        ranker_metrics.observe(name, elapsed, allocated)
+        timings[name] = {'ms': round(elapsed * 1000, 3)}
+        if allocated is not None:
+            timings[name]['allocated_bytes'] = allocated
+    return rankings, timings
 
-def bayesian_inference_uncertainty(actions):
-    """Applies Bayesian updating to model uncertainty in action predictions."""
+def rank_user_actions(user_actions, aggregates, mc_samples=MONTE_CARLO_SAMPLES, posteriors=None,
+                      stages=DEFAULT_RANKER_STAGES, profile_allocations=False):
+    """Run the ranker pipeline over a user's history.
+
+    ``posteriors`` are the user's bandit arms from ``load_agent_posteriors``.
+    Returns ``(rankings, timings)``.
+    """
+    context = {
+        'rng': make_rng(),
+        'aggregates': aggregates,
+        'posteriors': posteriors,
+        'mc_samples': mc_samples
+    }
+    return run_ranker_pipeline(ActionColumns(user_actions), context, stages, profile_allocations)
+
+def _init_ranker_worker():
+    """Process pool initializer: load the ranker models once per worker."""
     try:
-        for action in actions:
-            prior = np.random.beta(2, 5)  # Random prior distribution
-            likelihood = action.get('reward', 1) / 10.0  # Scale likelihood
-            posterior = (prior * likelihood) / ((prior * likelihood) + ((1 - prior) * (1 - likelihood)))
-            action['bayesian_score'] = posterior
-        return sorted(actions, key=lambda x: x.get('bayesian_score', 0), reverse=True)
+        ranker_models.load()
     except Exception as e:
-        print(f"[Error] Bayesian Inference failed: {str(e)}")
-        return actions
+        print(f"[Error] Loading ranker models in worker failed: {str(e)}")
+
+def _rank_in_worker(columns, aggregates, mc_samples, posteriors, stages, profile_allocations):
+    """Run the ranker pipeline inside a pool worker."""
+    ranker_models.reload_if_newer()
+    context = {
+        'rng': make_rng(),
+        'aggregates': aggregates,
+        'posteriors': posteriors,
+        'mc_samples': mc_samples
+    }
+    return run_ranker_pipeline(columns, context, stages, profile_allocations)
+
+class RankerProcessPool:
+    """Warm pool of worker processes for the CPU-bound ranker stages.
+
+    Requests hand their columnar history to a worker instead of ranking on
+    the Flask thread, so numeric work never holds the GIL that I/O-bound
+    requests are waiting on. Workers come from a ``forkserver`` (``spawn``
+    where unavailable), never a fork of this multi-threaded process, so
+    they cannot inherit Mongo monitor threads or locks held mid-request;
+    the initializer loads the ranker models once per worker.
+
+    A request whose ranking takes longer than ``timeout`` seconds gets the
+    cheap ``fallback_stages`` computed in-thread instead. The slow ranking
+    cannot be cancelled once running and keeps its worker busy until it
+    finishes; while every worker is busy with such a ranking, requests fall
+    back at once rather than queueing behind them. With ``workers`` set to 0
+    every ranking runs in-thread.
+    """
+
+    def __init__(self, workers, timeout, fallback_stages):
+        self.workers = workers
+        self.timeout = timeout
+        self.fallback_stages = fallback_stages
+        self._executor = None
+        self._overdue = set()  # Timed-out rankings still occupying a worker
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _context():
+        methods = multiprocessing.get_all_start_methods()
+        return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+    def start(self):
+        """Start the workers now (rather than on the first request) and return the executor."""
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=self._context(),
+                    initializer=_init_ranker_worker
+                )
+                for future in [self._executor.submit(os.getpid) for _ in range(self.workers)]:
+                    future.result()
+                print(f"[RL] Started {self.workers} ranker worker processes")
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self._overdue.clear()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _workers_free(self):
+        with self._lock:
+            self._overdue = {future for future in self._overdue if not future.done()}
+            return len(self._overdue) < self.workers
+
+    def rank(self, user_actions, aggregates, mc_samples=MONTE_CARLO_SAMPLES, posteriors=None,
+             stages=DEFAULT_RANKER_STAGES, profile_allocations=False):
+        """Rank a user's history in the pool. Returns ``(rankings, timings)``."""
+        executor = self.start()
+        if executor is None:
+            return rank_user_actions(user_actions, aggregates, mc_samples, posteriors, stages, profile_allocations)
+
+        columns = ActionColumns(user_actions)
+        started = time.perf_counter()
+        if not self._workers_free():
+            print("[RL] Every ranker worker is busy with an overdue ranking, falling back")
+            return self._fallback(columns, aggregates, posteriors, stages, started)
+        try:
+            future = executor.submit(_rank_in_worker, columns, aggregates, mc_samples, posteriors,
+                                     tuple(stages), profile_allocations)
+            rankings, timings = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                # Already running: it holds its worker until it finishes
+                with self._lock:
+                    self._overdue.add(future)
+            print(f"[RL] Ranking took over {self.timeout}s, falling back to {', '.join(self.fallback_stages)}")
+            return self._fallback(columns, aggregates, posteriors, stages, started)
+        except BrokenProcessPool:
+            print("[Error] Ranker worker pool broke, restarting it")
+            self._reset(executor)
+            return self._fallback(columns, aggregates, posteriors, stages, started)
+
+        # Stage metrics were recorded in the worker; mirror them here for /metrics
+        for name, timing in timings.items():
+            ranker_metrics.observe(name, timing['ms'] / 1000, timing.get('allocated_bytes'))
+        return rankings, timings
+
+    def _fallback(self, columns, aggregates, posteriors, stages, started):
+        context = {
+            'rng': make_rng(),
+            'aggregates': aggregates,
+            'posteriors': posteriors,
+            'mc_samples': MONTE_CARLO_SAMPLES
+        }
+        fallback = [stage for stage in self.fallback_stages if stage in stages] or list(self.fallback_stages)
+        waited = time.perf_counter() - started
+        ranker_metrics.observe('pool_fallback', waited)
+        rankings, timings = run_ranker_pipeline(columns, context, fallback)
+        timings['pool_fallback'] = {'ms': round(waited * 1000, 3)}
+        return rankings, timings
+
+ranker_pool = RankerProcessPool(RANKER_POOL_WORKERS, RANKER_POOL_TIMEOUT_SECONDS, RANKER_FALLBACK_STAGES)
+
+def build_user_suggestions(user_id, user_actions, aggregates, mc_samples=MONTE_CARLO_SAMPLES,
+                           max_actions=HISTORY_MAX_ACTIONS, max_age_days=HISTORY_MAX_AGE_DAYS, posteriors=None,
+                           stages=DEFAULT_RANKER_STAGES, profile_allocations=False):
+    """Rank a user's history and ask Gemini for their next actions."""
+    if posteriors is None:
+        posteriors = load_agent_posteriors([user_id])[user_id]
+    rankings, timings = ranker_pool.rank(user_actions, aggregates, mc_samples, posteriors,
+                                         stages, profile_allocations)
+    if has_request_context():
+        g.ranker_timings = timings
+
+    return format_suggestions(user_id, user_actions, aggregates, generate_suggestion_text(user_actions),
+                              summarize_rankings(user_actions, rankings), max_actions, max_age_days)
+
+def generate_suggestion_text(user_actions):
+    """Ask Gemini for next-action suggestions based on the history digest."""
+    prompt = build_suggestion_prompt(build_history_digest(user_actions))
+    print("prompt:", prompt)
+    # Get suggestions from Gemini
+    response = model.generate_content(prompt)
+    print("response:", response)
+    return response.text
+
+def get_precomputed_suggestions(user_id, version):
+    """Return suggestions stored by the precompute worker if they are fresh.
 
+    They are only used when they were generated for the current history
+    version (and default request parameters) within
+    RL_PRECOMPUTE_MAX_AGE_SECONDS.
+    """
+    document = user_suggestions_collection.find_one({
+        '_id': user_id,
+        'version': version,
+        'generated_at': {'$gte': datetime.now(timezone.utc) - timedelta(seconds=PRECOMPUTE_MAX_AGE_SECONDS)}
+    })
+    return document['payload'] if document else None
+
+def store_precomputed_suggestions(user_id, version, suggestions):
+    """Save suggestions generated off the request path."""
+    user_suggestions_collection.replace_one({'_id': user_id}, {
+        '_id': user_id,
+        'version': version,
+        'generated_at': datetime.now(timezone.utc),
+        'payload': suggestions
+    }, upsert=True)
+
+def format_suggestions(user_id, user_actions, aggregates, suggestion_text, ranking_summary,
+                       max_actions=HISTORY_MAX_ACTIONS, max_age_days=HISTORY_MAX_AGE_DAYS):
+    """Structure Gemini's response together with the local analysis."""
+    return {
+        'user_id': user_id,
+        'timestamp': datetime.now().isoformat(),
+        'recent_actions_analyzed': len(user_actions),
+        'history_window': {
+            'max_actions': max_actions,
+            'max_age_days': max_age_days
+        },
+        'suggestions': suggestion_text,
+        'rankings': ranking_summary,
+        'user_patterns': UserPatternProfile.from_aggregates(aggregates).to_dict()
+    }
+
+def build_fast_suggestions(user_id, aggregates):
+    """Suggestions from the local Markov model alone, with no LLM call.
+
+    ``?agent=``, ``?hour=`` and ``?last_task=`` override the context taken
+    from the user's latest action and the current UTC hour.
+    """
+    prediction = task_transitions.predict(
+        user_id,
+        history_version(aggregates),
+        agent=request.args.get('agent'),
+        hour=request.args.get('hour', type=int),
+        last_task=request.args.get('last_task'),
+        top_k=min(max(request.args.get('k', TRANSITION_TOP_K, type=int), 1), 10)
+    )
+    text = '\n'.join(
+        f"{rank}. {task['task_type']} ({task['probability'] * 100:.0f}% likely next)"
+        for rank, task in enumerate(prediction['next_tasks'], start=1)
+    )
+    return {
+        'user_id': user_id,
+        'timestamp': datetime.now().isoformat(),
+        'mode': 'fast',
+        'suggestions': text,
+        'next_tasks': prediction['next_tasks'],
+        'context': prediction['context'],
+        'level': prediction['level'],
+        'user_patterns': UserPatternProfile.from_aggregates(aggregates).to_dict()
+    }
+
+def sse_event(event, data):
+    """Encode one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
 @app.route('/api/user-suggestions/<user_id>', methods=['GET'])
 def get_user_suggestions(user_id):
     try:
         print(f"Received user_id: {user_id}")
-        
-        # Get user's recent actions from MongoDB (last 30 days)
-        from datetime import timezone
-        thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-
-        query = {
-            'user_id': str(user_id),  # Ensure user_id is treated as a string
-            # 'timestamp': {'$gte': thirty_days_ago}
-        }
-        
-        
-        user_actions = list(user_actions_collection.find(query).sort('timestamp', -1))
-        
-        
+        user_id = str(user_id)
+
+        aggregates = get_user_aggregates(user_id)
+        if not aggregates:
+            return jsonify({
+                'error': 'No recent user history found'
+            }), 404
+
+        # ?mode=fast answers from the local next-task model, skipping rankers and Gemini
+        if request.args.get('mode') == 'fast':
+            return jsonify(build_fast_suggestions(user_id, aggregates))
+
+        mc_samples = mc_samples_from_request()
+        max_actions, max_age_days = history_window_from_request()
+        stages = stages_from_request()
+        version = history_version(aggregates, mc_samples, max_actions, max_age_days, ','.join(stages))
+        cached = suggestion_cache.get(user_id, version)
+        if cached is not None:
+            response = jsonify(cached)
+            response.headers['X-Suggestion-Cache'] = 'hit'
+            return response
+
+        precomputed = get_precomputed_suggestions(user_id, version)
+        if precomputed is not None:
+            suggestion_cache.set(user_id, version, precomputed)
+            response = jsonify(precomputed)
+            response.headers['X-Suggestion-Cache'] = 'precomputed'
+            return response
+
+        # Get user's recent actions from MongoDB, bounded by the history window
+        user_actions = fetch_user_history(user_id, max_actions, max_age_days)
+
         if not user_actions:
             return jsonify({
                 'error': 'No recent user history found'
             }), 404
 
-        print("[RL] Running Deep Q-Learning Optimization...")
-        q_learning = deep_q_learning_optimization(user_actions)
+        suggestions = build_user_suggestions(user_id, user_actions, aggregates, mc_samples, max_actions,
+                                             max_age_days, stages=stages,
+                                             profile_allocations=profile_allocations_from_request())
 
-        print("[RL] Applying Monte Carlo Estimation...")
-        monte_carlo_ = monte_carlo_simulation(user_actions)
+        suggestion_cache.set(user_id, version, suggestions)
+        response = jsonify(suggestions)
+        response.headers['X-Suggestion-Cache'] = 'miss'
+        return response
 
-        print("[RL] Performing Policy Gradient Ranking...")
-        policy_gradient_ = policy_gradient_ranking(user_actions)
+    except Exception as e:
+        return jsonify({
+            'error': f'Error generating suggestions: {str(e)}'
+        }), 500
 
-        print("[RL] Selecting Best Agent via Multi-Armed Bandit...")
-        multi_agent = multi_armed_bandit_selection(user_actions)
+@app.route('/api/user-suggestions/<user_id>/stream', methods=['GET'])
+def stream_user_suggestions(user_id):
+    """Stream suggestions as Server-Sent Events.
 
-        print("[RL] Modeling Uncertainty with Bayesian Inference...")
-        bayesian = bayesian_inference_uncertainty(user_actions)
-        
-        prompt=f"""You are an AI assistant helping to analyze user behavior patterns and suggest next actions on our platform. 
-    Based on the following user history, suggest the next 3 most likely actions or tasks the user might want to perform.
-    Consider patterns in:
-    - Preferred time of day for different tasks
-    - Common task sequences
-    - Priority patterns
-    - Agent preferences
-    - Task completion rates
-    - User feedback patterns
-    
-    For each suggestion, provide:
-    1. The recommended action/task
-    2. Which agent should handle it
-    3. Suggested priority level
-    4. Brief explanation of why this suggestion is relevant
-    
-    Here's the user's recent history:{user_actions}.Remember the format of the answer should be such that it shouldnt look ai has generated it.Do not include these kind of words in response Okay, based on the user's recent activity, here are three suggested next actions:1. """
-        # Generate prompt based on user history
-       
-        print("prompt:", prompt)
-        # Get suggestions from Gemini
-        response = model.generate_content(prompt)
-        print("response:", response)
-        # Parse and structure Gemini's response
-        suggestions = {
-            'user_id': user_id,
+    ``patterns`` and ``rankings`` events are sent as soon as they are
+    computed locally, then the Gemini text arrives as ``suggestion`` chunks.
+    Once ``?deadline=`` seconds (RL_STREAM_DEADLINE_SECONDS by default) have
+    passed the stream ends with whatever text has arrived; the final
+    ``done`` event says whether the suggestion is complete.
+    """
+    user_id = str(user_id)
+    mc_samples = mc_samples_from_request()
+    max_actions, max_age_days = history_window_from_request()
+    stages = stages_from_request()
+    profile_allocations = profile_allocations_from_request()
+    deadline = time.monotonic() + request.args.get('deadline', STREAM_DEADLINE_SECONDS, type=float)
+
+    def events():
+        try:
+            aggregates = get_user_aggregates(user_id)
+            if not aggregates:
+                yield sse_event('error', {'error': 'No recent user history found'})
+                return
+            yield sse_event('patterns', {'user_id': user_id, 'user_patterns': UserPatternProfile.from_aggregates(aggregates).to_dict()})
+
+            version = history_version(aggregates, mc_samples, max_actions, max_age_days, ','.join(stages))
+            cached = suggestion_cache.get(user_id, version)
+            if cached is not None:
+                yield sse_event('rankings', {'recent_actions_analyzed': cached['recent_actions_analyzed'],
+                                             'rankings': cached['rankings']})
+                yield sse_event('suggestion', {'text': cached['suggestions']})
+                yield sse_event('done', {'complete': True, 'cached': True, 'timestamp': cached['timestamp']})
+                return
+
+            user_actions = fetch_user_history(user_id, max_actions, max_age_days)
+            if not user_actions:
+                yield sse_event('error', {'error': 'No recent user history found'})
+                return
+            rankings, timings = ranker_pool.rank(user_actions, aggregates, mc_samples,
+                                                 load_agent_posteriors([user_id])[user_id],
+                                                 stages, profile_allocations)
+            ranking_summary = summarize_rankings(user_actions, rankings)
+            yield sse_event('rankings', {'recent_actions_analyzed': len(user_actions), 'rankings': ranking_summary,
+                                         'timings': timings})
+
+            # Gemini is read on a separate thread so the deadline holds even
+            # while waiting for the next chunk.
+            prompt = build_suggestion_prompt(build_history_digest(user_actions))
+            chunks = queue.Queue()
+
+            def produce():
+                try:
+                    for chunk in model.generate_content(prompt, stream=True):
+                        chunks.put(('text', chunk.text))
+                    chunks.put(('end', None))
+                except Exception as e:
+                    chunks.put(('error', str(e)))
+
+            threading.Thread(target=produce, daemon=True).start()
+
+            text = []
+            complete = False
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    kind, value = chunks.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if kind == 'text':
+                    text.append(value)
+                    yield sse_event('suggestion', {'text': value})
+                elif kind == 'error':
+                    yield sse_event('error', {'error': f'Error generating suggestions: {value}'})
+                    break
+                else:
+                    complete = True
+                    break
+
+            if complete:
+                suggestion_cache.set(user_id, version, format_suggestions(
+                    user_id, user_actions, aggregates, ''.join(text), ranking_summary, max_actions, max_age_days))
+            yield sse_event('done', {'complete': complete, 'cached': False, 'timestamp': datetime.now().isoformat()})
+
+        except Exception as e:
+            yield sse_event('error', {'error': f'Error generating suggestions: {str(e)}'})
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/user-patterns/<user_id>', methods=['GET'])
+def get_user_patterns(user_id):
+    """Return a user's pattern profile, optionally limited to ?since_days=."""
+    try:
+        since_days = request.args.get('since_days', type=float)
+        since = datetime.now(timezone.utc) - timedelta(days=since_days) if since_days else None
+        profile = UserPatternProfile.for_user(str(user_id), since)
+        if not profile.action_count:
+            return jsonify({'error': 'No recent user history found'}), 404
+        return jsonify({
+            'user_id': profile.user_id,
+            'actions': profile.action_count,
+            'user_patterns': profile.to_dict(),
+            'agent_counts': profile.agent_counts,
+            'task_counts': profile.task_counts,
+            'priority_counts': profile.priority_counts
+        })
+    except Exception as e:
+        return jsonify({
+            'error': f'Error computing user patterns: {str(e)}'
+        }), 500
+
+@app.route('/api/user-suggestions/batch', methods=['POST'])
+def get_batch_user_suggestions():
+    """Generate suggestions for many users at once.
+
+    Expects ``{"user_ids": [...]}``. Histories are fetched with parallel
+    indexed per-user reads and the Gemini calls run with bounded
+    concurrency; results and errors are reported per user.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in data.get('user_ids') or []))
+        if not user_ids:
+            return jsonify({'error': 'No user_ids provided'}), 400
+        if len(user_ids) > BATCH_MAX_USERS:
+            return jsonify({'error': f'At most {BATCH_MAX_USERS} user_ids per batch'}), 400
+
+        mc_samples = mc_samples_from_request()
+        max_actions, max_age_days = history_window_from_request()
+        stages = stages_from_request()
+        results = {}
+        errors = {}
+
+        all_aggregates = get_many_user_aggregates(user_ids)
+        pending = {}
+        for user_id in user_ids:
+            aggregates = all_aggregates.get(user_id)
+            if not aggregates:
+                errors[user_id] = 'No recent user history found'
+                continue
+            version = history_version(aggregates, mc_samples, max_actions, max_age_days, ','.join(stages))
+            cached = suggestion_cache.get(user_id, version)
+            if cached is not None:
+                results[user_id] = cached
+            else:
+                pending[user_id] = (aggregates, version)
+
+        histories = fetch_user_histories(pending, max_actions, max_age_days) if pending else {}
+        for user_id in list(pending):
+            if not histories.get(user_id):
+                errors[user_id] = 'No recent user history found'
+                del pending[user_id]
+
+        posteriors = load_agent_posteriors(pending) if pending else {}
+
+        def generate(user_id):
+            aggregates, version = pending[user_id]
+            suggestions = build_user_suggestions(user_id, histories[user_id], aggregates,
+                                                 mc_samples, max_actions, max_age_days, posteriors[user_id],
+                                                 stages)
+            suggestion_cache.set(user_id, version, suggestions)
+            return suggestions
+
+        with ThreadPoolExecutor(max_workers=max(1, min(BATCH_LLM_CONCURRENCY, len(pending) or 1))) as executor:
+            futures = {user_id: executor.submit(generate, user_id) for user_id in pending}
+            for user_id, future in futures.items():
+                try:
+                    results[user_id] = future.result()
+                except Exception as e:
+                    errors[user_id] = f'Error generating suggestions: {str(e)}'
+
+        return jsonify({
             'timestamp': datetime.now().isoformat(),
-            'recent_actions_analyzed': len(user_actions),
-            'suggestions': response.text,
-            'user_patterns': {
-                'most_used_agent': max(set(a['agent_used'] for a in user_actions), 
-                                     key=lambda x: sum(1 for a in user_actions if a['agent_used'] == x)),
-                'average_feedback': sum(a['feedback_score'] for a in user_actions) / len(user_actions),
-                'common_priority': max(set(a['priority_level'] for a in user_actions), 
-                                    key=lambda x: sum(1 for a in user_actions if a['priority_level'] == x))
-            }
-        }
+            'results': results,
+            'errors': errors
+        })
+
+    except Exception as e:
+        return jsonify({
+            'error': f'Error generating batch suggestions: {str(e)}'
+        }), 500
+
+@app.after_request
+def add_ranker_timing_headers(response):
+    """Expose the ranker stage breakdown of this request as debug headers."""
+    timings = g.pop('ranker_timings', None)
+    if timings:
+        response.headers['Server-Timing'] = ', '.join(
+            f"{stage};dur={timing['ms']}" for stage, timing in timings.items())
+        allocations = {stage: timing['allocated_bytes'] for stage, timing in timings.items()
+                       if 'allocated_bytes' in timing}
+        if allocations:
+            response.headers['X-Ranker-Allocations'] = ', '.join(
+                f"{stage}={size}" for stage, size in allocations.items())
+    return response
 
-        return jsonify(suggestions)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for the ranker pipeline and the ingestion buffer."""
+    return Response(ranker_metrics.render() + interaction_buffer.render(), mimetype='text/plain; version=0.0.4')
 
+@app.route('/api/interactions/bulk', methods=['POST'])
+def ingest_interactions():
+    """Accept a batch of interactions for buffered writing.
+
+    The body is ``{"interactions": [...]}`` (or a bare list) of objects in
+    the ``user_data`` schema. Valid interactions are accepted even if others
+    in the batch are rejected; ``?sync=1`` flushes the buffer before
+    responding.
+    """
+    try:
+        data = request.get_json(silent=True)
+        raw_interactions = data.get('interactions') if isinstance(data, dict) else data
+        if not isinstance(raw_interactions, list) or not raw_interactions:
+            return jsonify({'error': 'Expected a non-empty "interactions" list'}), 400
+        if len(raw_interactions) > INGEST_MAX_REQUEST_ITEMS:
+            return jsonify({'error': f'At most {INGEST_MAX_REQUEST_ITEMS} interactions per request'}), 400
+
+        accepted = []
+        rejected = []
+        for index, raw in enumerate(raw_interactions):
+            action, error = validate_interaction(raw)
+            if error:
+                rejected.append({'index': index, 'error': error})
+            else:
+                accepted.append(action)
+        if not accepted:
+            return jsonify({'accepted': 0, 'rejected': rejected}), 400
+
+        pending = interaction_buffer.add(accepted)
+        if request.args.get('sync') in ('1', 'true'):
+            interaction_buffer.flush()
+            pending = interaction_buffer.pending
+        return jsonify({
+            'accepted': len(accepted),
+            'rejected': rejected,
+            'pending': pending
+        }), 202
     except Exception as e:
         return jsonify({
-            'error': f'Error generating suggestions: {str(e)}'
+            'error': f'Error ingesting interactions: {str(e)}'
         }), 500
-    
+
 @app.route('/update/agent', methods=['POST'])
-def health_check():
+def update_agent():
+    """Apply reward feedback to the agent bandit.
+
+    Accepts ``{"user_id", "agent", "reward"}`` or ``{"updates": [...]}`` of
+    such objects, with rewards in [0, 1] (1 = success).
+    """
     try:
-        # Check if MongoDB is connected
-        db_status = client.admin.command('ping')  # MongoDB health check
-        
+        data = request.get_json(silent=True)
+        raw_updates = data.get('updates', [data]) if isinstance(data, dict) else None
+        if not isinstance(raw_updates, list):
+            return jsonify({
+                'status': 'invalid',
+                'error': 'Expected an update object or {"updates": [...]}'
+            }), 400
+        updates = []
+        for update in raw_updates:
+            if not isinstance(update, dict):
+                return jsonify({'status': 'invalid', 'error': 'Each update must be an object'}), 400
+            user_id, agent, reward = update.get('user_id'), update.get('agent'), update.get('reward')
+            if (not isinstance(user_id, str) or not user_id or not isinstance(agent, str)
+                    or isinstance(reward, bool) or not isinstance(reward, (int, float)) or not 0 <= reward <= 1):
+                return jsonify({
+                    'status': 'invalid',
+                    'error': 'Each update needs user_id, agent and a reward between 0 and 1'
+                }), 400
+            if agent not in INTERACTION_CATEGORIES['agent_used']:
+                return jsonify({'status': 'invalid', 'error': f"Unknown agent '{agent}'"}), 400
+            updates.append((user_id, agent, float(reward)))
+
+        record_agent_rewards(updates)
+        for user_id in {user_id for user_id, _, _ in updates}:
+            suggestion_cache.invalidate(user_id)
+
         return jsonify({
-            'status': 'ai agent has been successfully updated and retrained with new rewards',
+            'status': 'ai agent has been successfully updated with new rewards',
             'message': 'Updation Sucessful',
-            'db_status': db_status
+            'updates_applied': len(updates)
         }), 200
     except Exception as e:
         return jsonify({
@@ -370,5 +2301,40 @@ def health_check():
             'error': str(e)
         }), 500
 
+@app.route('/api/select-agent/<user_id>', methods=['GET'])
+def select_agent(user_id):
+    """Pick an agent for the user by Thompson sampling their stored posteriors."""
+    try:
+        user_id = str(user_id)
+        posteriors = load_agent_posteriors([user_id])[user_id]
+        aggregates = get_user_aggregates(user_id) or {}
+        agent_names = sorted(set(posteriors) | set(aggregates.get('agent_counts', {})))
+        if not agent_names:
+            return jsonify({'error': 'No agents recorded for this user'}), 404
+
+        alpha, beta_ = posterior_arrays(agent_names, posteriors)
+        sampled = make_rng().beta(alpha, beta_)
+        return jsonify({
+            'user_id': user_id,
+            'selected_agent': restore_key(agent_names[int(np.argmax(sampled))]),
+            'posterior_means': {
+                restore_key(name): mean for name, mean in zip(agent_names, (alpha / (alpha + beta_)).tolist())
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            'error': f'Error selecting agent: {str(e)}'
+        }), 500
+
+try:
+    ranker_models.load()
+except Exception as e:
+    print(f"[Error] Loading ranker models failed: {str(e)}")
+
 if __name__ == '__main__':
+    ensure_indexes()
+    # Warm the ranker workers before the first request
+    ranker_pool.start()
+    ranker_models.start_background_training()
+    task_transitions.start_background_rebuild()
     app.run(host='0.0.0.0', port=5010)
\ No newline at end of file
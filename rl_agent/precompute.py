@@ -0,0 +1,130 @@
+"""Background worker that precomputes suggestions for recently active users.
+
+Each cycle finds users with new actions or aggregate updates since the
+previous cycle, skips those whose stored suggestions already match their
+history version, runs the local rankers in a process pool and the Gemini
+calls on a bounded thread pool, and stores the results in the
+``user_suggestions`` collection. The suggestions endpoint serves these
+while they are fresh.
+
+Usage:
+    python precompute.py                  # run forever, every 5 minutes
+    python precompute.py --once           # single pass
+    python precompute.py --interval 60 --since-hours 24
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from model import (
+    BATCH_MAX_USERS, DEFAULT_RANKER_STAGES, HISTORY_MAX_ACTIONS, HISTORY_MAX_AGE_DAYS, MONTE_CARLO_SAMPLES,
+    ensure_indexes, fetch_user_histories, format_suggestions, generate_suggestion_text, get_many_user_aggregates,
+    history_version, load_agent_posteriors, rank_user_actions, store_precomputed_suggestions,
+    summarize_rankings, user_actions_collection, user_aggregates_collection, user_suggestions_collection
+)
+
+def rank_and_summarize(user_actions, aggregates, posteriors):
+    """Run the local rankers for one user (executed in a worker process)."""
+    rankings, _ = rank_user_actions(user_actions, aggregates, MONTE_CARLO_SAMPLES, posteriors)
+    return summarize_rankings(user_actions, rankings)
+
+def find_stale_users(since):
+    """Users active since ``since`` whose stored suggestions are out of date.
+
+    Activity is either an aggregate update or a raw ``user_data`` row newer
+    than ``since``, so actions written straight to ``user_data`` are seen
+    too; their aggregates are brought up to date on the way.
+    """
+    active = {doc['_id'] for doc in user_aggregates_collection.find({'updated_at': {'$gte': since}}, {'_id': 1})}
+    active.update(
+        str(user_id) for user_id in user_actions_collection.distinct('user_id', {'timestamp': {'$gte': since}})
+    )
+    aggregates = {
+        user_id: doc for user_id, doc in get_many_user_aggregates(active).items() if doc is not None
+    }
+    if not aggregates:
+        return {}
+    versions = {
+        user_id: history_version(doc, MONTE_CARLO_SAMPLES, HISTORY_MAX_ACTIONS, HISTORY_MAX_AGE_DAYS,
+                                 ','.join(DEFAULT_RANKER_STAGES))
+        for user_id, doc in aggregates.items()
+    }
+    stored = {
+        doc['_id']: doc['version']
+        for doc in user_suggestions_collection.find({'_id': {'$in': list(aggregates)}}, {'version': 1})
+    }
+    return {
+        user_id: (aggregates[user_id], version)
+        for user_id, version in versions.items()
+        if stored.get(user_id) != version
+    }
+
+def precompute_batch(stale_users, process_pool, llm_concurrency):
+    """Generate and store suggestions for one batch of users."""
+    histories = fetch_user_histories(list(stale_users), HISTORY_MAX_ACTIONS, HISTORY_MAX_AGE_DAYS)
+    histories = {user_id: actions for user_id, actions in histories.items() if actions}
+    posteriors = load_agent_posteriors(histories)
+
+    ranking_futures = {
+        user_id: process_pool.submit(rank_and_summarize, actions, stale_users[user_id][0], posteriors[user_id])
+        for user_id, actions in histories.items()
+    }
+
+    def generate(user_id):
+        aggregates, version = stale_users[user_id]
+        user_actions = histories[user_id]
+        ranking_summary = ranking_futures[user_id].result()
+        suggestions = format_suggestions(user_id, user_actions, aggregates,
+                                         generate_suggestion_text(user_actions), ranking_summary,
+                                         HISTORY_MAX_ACTIONS, HISTORY_MAX_AGE_DAYS)
+        store_precomputed_suggestions(user_id, version, suggestions)
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=llm_concurrency) as executor:
+        futures = {user_id: executor.submit(generate, user_id) for user_id in histories}
+        for user_id, future in futures.items():
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                print(f"[Error] Precompute failed for user {user_id}: {str(e)}")
+    return done
+
+def run_cycle(since, process_pool, llm_concurrency):
+    """Precompute suggestions for every stale user active since ``since``."""
+    stale_users = find_stale_users(since)
+    print(f"[Precompute] {len(stale_users)} users need fresh suggestions")
+    user_ids = list(stale_users)
+    done = 0
+    for start in range(0, len(user_ids), BATCH_MAX_USERS):
+        batch = {user_id: stale_users[user_id] for user_id in user_ids[start:start + BATCH_MAX_USERS]}
+        done += precompute_batch(batch, process_pool, llm_concurrency)
+    print(f"[Precompute] Stored suggestions for {done} users")
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute suggestions for active users.")
+    parser.add_argument('--interval', type=int, default=300, help="Seconds between cycles")
+    parser.add_argument('--since-hours', type=float, default=24,
+                        help="How far back the first cycle looks for activity")
+    parser.add_argument('--workers', type=int, default=None, help="Ranker processes (default: CPU count)")
+    parser.add_argument('--llm-concurrency', type=int, default=8, help="Concurrent Gemini calls")
+    parser.add_argument('--once', action='store_true', help="Run a single cycle and exit")
+    args = parser.parse_args()
+
+    ensure_indexes()
+    since = datetime.now(timezone.utc) - timedelta(hours=args.since_hours)
+    with ProcessPoolExecutor(max_workers=args.workers) as process_pool:
+        while True:
+            cycle_started = datetime.now(timezone.utc)
+            try:
+                run_cycle(since, process_pool, args.llm_concurrency)
+                since = cycle_started
+            except Exception as e:
+                print(f"[Error] Precompute cycle failed: {str(e)}")
+            if args.once:
+                break
+            time.sleep(args.interval)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+from flask import Flask, jsonify, request
+from flask_cors import CORS
+from concurrent.futures import Future
+from dotenv import load_dotenv
+import joblib
+import math
+import os
+import queue
+import threading
+import time
+
+from data import is_pair, predict_tasks
+from features import INPUT_COLUMNS
+
+# Load environment variables
+load_dotenv()
+
+app = Flask(__name__)
+CORS(app)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.getenv('RL_TASK_MODEL_PATH', os.path.join(BASE_DIR, 'task_prediction_model.joblib'))
+ENCODERS_PATH = os.getenv('RL_TASK_ENCODERS_PATH', os.path.join(BASE_DIR, 'feature_encoders.joblib'))
+TRANSFORMER_PATH = os.getenv('RL_TASK_TRANSFORMER_PATH', os.path.join(BASE_DIR, 'feature_transformer.joblib'))
+BATCH_WINDOW_MS = float(os.getenv('RL_PREDICT_BATCH_WINDOW_MS', 5))
+MAX_BATCH_SIZE = int(os.getenv('RL_PREDICT_MAX_BATCH_SIZE', 512))
+MAX_REQUEST_ROWS = int(os.getenv('RL_PREDICT_MAX_REQUEST_ROWS', 1000))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('RL_PREDICT_TIMEOUT_SECONDS', 5))
+RELOAD_CHECK_SECONDS = float(os.getenv('RL_PREDICT_RELOAD_CHECK_SECONDS', 5))
+
+# Raw features the transformer divides by (efficiency_score = duration / response_time)
+POSITIVE_FEATURES = {'response_time'}
+
+class TaskPredictor:
+    """The task prediction model and its feature pipeline, loaded once at startup.
+
+    When a fitted feature transformer was saved with the model, rows are raw
+    interactions and the transformer builds the features; otherwise rows
+    must already carry the model's engineered feature columns. The model and
+    transformer are reloaded together when either file's mtime changes, so
+    a retrained or atomically updated pair (``data.py train``/``update``) is
+    picked up without a restart. A model whose recorded transformer version
+    does not match is not swapped in.
+    """
+
+    def __init__(self, model_path, encoders_path, transformer_path=None):
+        self.model_path = model_path
+        self.transformer_path = transformer_path
+        self.next_reload_check = time.monotonic() + RELOAD_CHECK_SECONDS
+        self.base_encoders = joblib.load(encoders_path)
+        mtimes = self._mtimes()
+        self._install(*self._load_pair(mtimes), mtimes)
+
+    def _mtimes(self):
+        transformer_mtime = None
+        if self.transformer_path and os.path.exists(self.transformer_path):
+            transformer_mtime = os.path.getmtime(self.transformer_path)
+        return os.path.getmtime(self.model_path), transformer_mtime
+
+    def _load_pair(self, mtimes):
+        """Load the model and its transformer, refusing a mismatched pair."""
+        model = joblib.load(self.model_path)
+        transformer = joblib.load(self.transformer_path) if mtimes[1] is not None else None
+        if transformer is not None and not is_pair(model, transformer):
+            raise ValueError(f"{self.model_path} was not trained with {self.transformer_path}")
+        return model, transformer
+
+    def _install(self, model, transformer, mtimes):
+        self.model = model
+        self.transformer = transformer
+        self.model_mtime, self.transformer_mtime = mtimes
+        self.encoders = transformer.label_encoders() if transformer else self.base_encoders
+        self.feature_names = list(INPUT_COLUMNS) if transformer else list(model.feature_names_in_)
+        self.categorical = {
+            name: set(encoder.classes_) for name, encoder in self.encoders.items() if name != 'target'
+        }
+        self.numerical = [name for name in self.feature_names if name not in self.categorical]
+        # Only raw interactions are divided by; pre-scaled features may be negative
+        self.positive = POSITIVE_FEATURES if transformer else set()
+
+    def validate(self, row):
+        """Check one row before it is batched with other requests.
+
+        Returns ``(row, None)`` with numeric features coerced to floats, or
+        ``(None, error)`` for a row the model cannot score.
+        """
+        if not isinstance(row, dict):
+            return None, "Expected an object of features"
+        missing = [name for name in self.feature_names if name not in row]
+        if missing:
+            return None, f"Missing features: {', '.join(missing)}"
+        for name, labels in self.categorical.items():
+            if str(row[name]) not in labels:
+                return None, f"Unknown {name} '{row[name]}'"
+        row = dict(row)
+        for name in self.numerical:
+            value = row[name]
+            try:
+                if isinstance(value, bool):
+                    raise ValueError
+                value = float(value)
+            except (TypeError, ValueError):
+                return None, f"{name} must be a number"
+            if not math.isfinite(value):
+                return None, f"{name} must be finite"
+            if name in self.positive and value <= 0:
+                return None, f"{name} must be positive"
+            row[name] = value
+        return row, None
+
+    def reload_if_changed(self):
+        """Swap in the model and transformer if either file was replaced."""
+        now = time.monotonic()
+        if now < self.next_reload_check:
+            return
+        self.next_reload_check = now + RELOAD_CHECK_SECONDS
+        try:
+            mtimes = self._mtimes()
+            if mtimes == (self.model_mtime, self.transformer_mtime):
+                return
+            self._install(*self._load_pair(mtimes), mtimes)
+            print(f"[Predict] Reloaded model from {self.model_path}")
+        except Exception as e:
+            # A half-finished retrain is retried at the next check
+            print(f"[Error] Failed to reload model, keeping the current one: {str(e)}")
+
+    def predict(self, rows):
+        self.reload_if_changed()
+        return predict_tasks(rows, self.model, self.encoders, self.transformer)
+
+class MicroBatcher:
+    """Coalesces concurrent prediction requests into a single model call.
+
+    The worker thread waits up to ``window_ms`` after the first queued
+    request for others to arrive (or until ``max_batch_size`` rows are
+    queued), scores all their rows together and hands each request back its
+    own slice of the results. If the combined call fails, each request is
+    re-scored on its own, so the failure stays with the request that caused
+    it.
+    """
+
+    def __init__(self, predict_fn, window_ms, max_batch_size):
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, rows):
+        """Queue rows for prediction; returns a Future of (labels, confidences)."""
+        future = Future()
+        self._queue.put((rows, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            rows = [row for request_rows, _ in batch for row in request_rows]
+            try:
+                labels, confidences = self.predict_fn(rows)
+            except Exception:
+                # Score each request on its own so one bad request only fails itself
+                for request_rows, future in batch:
+                    try:
+                        future.set_result(self.predict_fn(request_rows))
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            start = 0
+            for request_rows, future in batch:
+                stop = start + len(request_rows)
+                future.set_result((labels[start:stop], confidences[start:stop]))
+                start = stop
+
+predictor = TaskPredictor(MODEL_PATH, ENCODERS_PATH, TRANSFORMER_PATH)
+batcher = MicroBatcher(predictor.predict, BATCH_WINDOW_MS, MAX_BATCH_SIZE)
+
+def predict_rows(rows):
+    """Validate rows, score them through the micro-batcher and format the results."""
+    validated = []
+    for index, row in enumerate(rows):
+        row, error = predictor.validate(row)
+        if error:
+            raise ValueError(f"Row {index}: {error}")
+        validated.append(row)
+    rows = validated
+    labels, confidences = batcher.submit(rows).result(timeout=REQUEST_TIMEOUT_SECONDS)
+    return [
+        {'task_type': label, 'confidence': round(confidence, 4)}
+        for label, confidence in zip(labels, confidences)
+    ]
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    """Predict the next task for one feature row."""
+    try:
+        row = request.get_json(silent=True)
+        if not isinstance(row, dict):
+            return jsonify({'error': 'Expected a JSON object of features'}), 400
+        return jsonify(predict_rows([row])[0])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error predicting task: {str(e)}'}), 500
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Predict the next task for ``{"rows": [...]}``."""
+    try:
+        rows = (request.get_json(silent=True) or {}).get('rows')
+        if not isinstance(rows, list) or not rows:
+            return jsonify({'error': 'Expected a non-empty "rows" list'}), 400
+        if len(rows) > MAX_REQUEST_ROWS:
+            return jsonify({'error': f'At most {MAX_REQUEST_ROWS} rows per request'}), 400
+        return jsonify({'predictions': predict_rows(rows)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error predicting tasks: {str(e)}'}), 500
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    return jsonify({
+        'status': 'healthy',
+        'features': predictor.feature_names,
+        'feature_transformer': predictor.transformer is not None,
+        'model_mtime': predictor.model_mtime,
+        'transformer_mtime': predictor.transformer_mtime
+    })
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=int(os.getenv('RL_PREDICT_PORT', 5011)), threaded=True)
@@ -0,0 +1,141 @@
+"""Background job that compacts old ``user_data`` into per-user daily rollups.
+
+Actions older than the horizon are folded, one user at a time, into
+``user_data_daily`` documents (one per user and day) holding the same counts
+and reward/feedback sums as the aggregate documents plus the task
+transitions of that day, and are then deleted from ``user_data``. Recent
+actions stay raw, and so do each user's newest ``--keep-recent`` actions
+however old, so the suggestion path always has a recent history to rank.
+Aggregate backfills, windowed pattern profiles and the next-task model read
+the rollups alongside the raw actions, so scans are bounded by the recent
+window plus one document per day of older history. Each rollup also keeps
+a sample of its day's newest actions, which the suggestion history falls
+back to when a user has no raw actions left, and its last action, from
+which later runs and the raw actions continue the task-transition chain.
+
+Rollups are written before the raw actions are deleted, so a job that dies
+in between can at worst count those actions twice on its next run, never
+lose them.
+
+Usage:
+    python rollup.py --once                    # single pass, 30-day horizon
+    python rollup.py --horizon-days 14 --interval 86400
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+
+from pymongo import UpdateOne
+
+from model import (
+    HISTORY_MAX_ACTIONS, HISTORY_PROJECTION, aggregate_increments, ensure_indexes, merge_increments,
+    rolled_last_action, transition_increments, user_actions_collection, user_data_daily_collection
+)
+
+ROLLUP_PROJECTION = dict(HISTORY_PROJECTION, _id=1)
+DELETE_CHUNK_SIZE = 10000
+SAMPLE_ACTIONS_PER_DAY = 50  # Newest actions kept on each rollup for the suggestion history fallback
+
+def action_day(action):
+    timestamp = action['timestamp']
+    return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+def rollup_cutoff(user_id, horizon, keep_recent):
+    """Actions before this timestamp are rolled up: the horizon, or earlier
+    if that would leave the user fewer than ``keep_recent`` raw actions."""
+    if keep_recent <= 0:
+        return horizon
+    kept = list(user_actions_collection.find({'user_id': user_id}, {'_id': 0, 'timestamp': 1})
+                .sort('timestamp', -1).skip(keep_recent - 1).limit(1))
+    if not kept:
+        return None
+    kept_timestamp = kept[0]['timestamp']
+    if kept_timestamp.tzinfo is None:
+        kept_timestamp = kept_timestamp.replace(tzinfo=timezone.utc)
+    return min(horizon, kept_timestamp)
+
+def history_sample(actions):
+    """The day's newest actions, in the shape the suggestion history uses."""
+    newest = sorted(actions, key=lambda action: action['timestamp'], reverse=True)[:SAMPLE_ACTIONS_PER_DAY]
+    return [{field: action[field] for field in HISTORY_PROJECTION if field in action} for action in newest]
+
+def rollup_user(user_id, horizon, keep_recent=HISTORY_MAX_ACTIONS):
+    """Fold one user's actions older than ``horizon`` into daily rollups.
+
+    The user's newest ``keep_recent`` actions always stay raw, so the
+    suggestion path keeps a full recent history. Returns the number of
+    actions rolled up.
+    """
+    cutoff = rollup_cutoff(user_id, horizon, keep_recent)
+    if cutoff is None:
+        return 0
+    cursor = user_actions_collection.find(
+        {'user_id': user_id, 'timestamp': {'$lt': cutoff}}, ROLLUP_PROJECTION
+    ).sort('timestamp', 1)
+
+    now = datetime.now(timezone.utc)
+    operations = []
+    rolled_ids = []
+    previous = rolled_last_action(user_id)  # Continue the chain from the previous run
+    for day, actions in groupby(cursor, key=action_day):
+        actions = list(actions)
+        rolled_ids.extend(action['_id'] for action in actions)
+        increments, last_timestamp = aggregate_increments(actions)
+        transitions, previous = transition_increments(actions, previous)
+        merge_increments(increments, transitions)
+        operations.append(UpdateOne(
+            {'_id': f"{user_id}|{day.date().isoformat()}"},
+            {
+                '$inc': increments,
+                '$max': {'last_timestamp': last_timestamp},
+                '$set': {'last_action': previous, 'updated_at': now},
+                '$push': {'recent_actions': {
+                    '$each': history_sample(actions), '$sort': {'timestamp': -1}, '$slice': SAMPLE_ACTIONS_PER_DAY
+                }},
+                '$setOnInsert': {'user_id': user_id, 'day': day}
+            },
+            upsert=True
+        ))
+
+    if not operations:
+        return 0
+    user_data_daily_collection.bulk_write(operations, ordered=False)
+    for start in range(0, len(rolled_ids), DELETE_CHUNK_SIZE):
+        user_actions_collection.delete_many({'_id': {'$in': rolled_ids[start:start + DELETE_CHUNK_SIZE]}})
+    return len(rolled_ids)
+
+def run_rollup(horizon_days, keep_recent=HISTORY_MAX_ACTIONS):
+    """Roll up every user with actions older than ``horizon_days``."""
+    horizon = datetime.now(timezone.utc) - timedelta(days=horizon_days)
+    user_ids = user_actions_collection.distinct('user_id', {'timestamp': {'$lt': horizon}})
+    print(f"[Rollup] {len(user_ids)} users have actions older than {horizon.isoformat()}")
+
+    total = 0
+    for user_id in user_ids:
+        try:
+            total += rollup_user(user_id, horizon, keep_recent)
+        except Exception as e:
+            print(f"[Error] Rolling up user {user_id} failed: {str(e)}")
+    print(f"[Rollup] Rolled up and removed {total} actions")
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact old user_data into per-user daily rollups.")
+    parser.add_argument('--horizon-days', type=float, default=30,
+                        help="Actions older than this many days are rolled up")
+    parser.add_argument('--interval', type=int, default=86400, help="Seconds between runs")
+    parser.add_argument('--keep-recent', type=int, default=HISTORY_MAX_ACTIONS,
+                        help="Newest actions per user that always stay raw, whatever their age")
+    parser.add_argument('--once', action='store_true', help="Run a single pass and exit")
+    args = parser.parse_args()
+
+    ensure_indexes()
+    while True:
+        run_rollup(args.horizon_days, args.keep_recent)
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify, Flask
 import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 import json
@@ -20,6 +21,12 @@ executive_agent = Blueprint('executive_agent', __name__)
 genai.configure(api_key=GOOGLE_API_KEY)
 model = genai.GenerativeModel('gemini-pro')
 
+# Email analysis configuration: 'parallel' runs the three Gemini calls
+# concurrently, 'single' asks for everything in one structured call
+ANALYSIS_MODE = os.getenv('EMAIL_ANALYSIS_MODE', 'parallel')
+ANALYSIS_CALL_TIMEOUT_SECONDS = float(os.getenv('EMAIL_ANALYSIS_TIMEOUT_SECONDS', 30))
+analysis_executor = ThreadPoolExecutor(max_workers=int(os.getenv('EMAIL_ANALYSIS_WORKERS', 12)))
+
 class EmailAnalyzer:
     def __init__(self, email_content, sender_email=''):
         if not email_content:
@@ -28,9 +35,78 @@ class EmailAnalyzer:
         self.sender_email = sender_email
         self.model = model
     
-    def analyze_email(self):
-        """Perform comprehensive email analysis in a single Gemini call"""
-        prompt = f"""
+    def analyze_email(self, mode=None):
+        """Perform comprehensive email analysis.
+
+        In ``parallel`` mode the main analysis, calendar and task
+        extraction calls run concurrently, each bounded by
+        EMAIL_ANALYSIS_TIMEOUT_SECONDS from when it starts; if one fails or
+        times out the others are still returned and the failure is listed
+        under ``errors``. In ``single`` mode one structured call returns all
+        three parts.
+        """
+        mode = mode or ANALYSIS_MODE
+        if mode == 'single':
+            return self._analyze_in_one_call()
+
+        futures = {
+            'analysis': analysis_executor.submit(self._generate, self._analysis_prompt()),
+            'calendar': analysis_executor.submit(self._generate, self._calendar_prompt()),
+            'tasks': analysis_executor.submit(self._generate, self._tasks_prompt())
+        }
+        results = {}
+        errors = {}
+        for name, future in futures.items():
+            # Each call is bounded by its own request timeout from the moment it
+            # starts, so time spent queued behind other requests is not counted
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = str(e)
+        if len(errors) == len(futures):
+            raise RuntimeError(f"Email analysis failed: {errors}")
+
+        analysis_results = results.get('analysis', {})
+
+        # Parse calendar meetings with better error handling
+        calendar_data = results.get('calendar')
+        if isinstance(calendar_data, dict) and 'meetings' in calendar_data:
+            analysis_results['calendar_meetings'] = calendar_data['meetings']
+        else:
+            analysis_results['calendar_meetings'] = []
+
+        # Parse tasks with better error handling
+        tasks_data = results.get('tasks')
+        if isinstance(tasks_data, dict) and 'tasks' in tasks_data:
+            analysis_results['notion_tasks'] = tasks_data['tasks']
+        else:
+            analysis_results['notion_tasks'] = []
+
+        if errors:
+            print(f"Partial email analysis, failed calls: {errors}")
+            analysis_results['errors'] = errors
+        return analysis_results
+
+    def _analyze_in_one_call(self):
+        """Get the analysis, calendar meetings and tasks from one structured call."""
+        analysis_results = self._generate(self._combined_prompt())
+        if not isinstance(analysis_results, dict):
+            analysis_results = {}
+        for key in ('calendar_meetings', 'notion_tasks'):
+            if not isinstance(analysis_results.get(key), list):
+                analysis_results[key] = []
+        analysis_results.pop('meetings', None)
+        return analysis_results
+
+    def _generate(self, prompt):
+        """Run one Gemini call, bounded by the per-call timeout, and parse it."""
+        response = self.model.generate_content(
+            prompt, request_options={'timeout': ANALYSIS_CALL_TIMEOUT_SECONDS})
+        return self._parse_response(response)
+
+    def _analysis_prompt(self):
+        """Prompt for the main NLP, priority, spam and authority analysis."""
+        return f"""
         Analyze this email comprehensively and return ONLY a JSON object with the following structure:
         
         Remember this carefully !!
@@ -74,12 +150,10 @@ class EmailAnalyzer:
 
         Important: Return ONLY the JSON object with no additional text, markdown formatting, or explanation.
         """
-        
-        response = self.model.generate_content(prompt)
-        analysis_results = self._parse_response(response)
-        
-        # Modified calendar meetings prompt to enforce JSON structure
-        calendar_prompt = f"""
+
+    def _calendar_prompt(self):
+        """Prompt that extracts calendar meetings."""
+        return f"""
         Extract all calendar meetings from this email and return them in this exact JSON format:
         {{
             "meetings": []
@@ -90,8 +164,10 @@ class EmailAnalyzer:
 
         Return ONLY the JSON object.
         """
-        
-        tasks_prompt = f"""
+
+    def _tasks_prompt(self):
+        """Prompt that extracts tasks."""
+        return f"""
         Extract all tasks from this email and return them in this exact JSON format:
         {{
             "tasks": []
@@ -105,26 +181,61 @@ class EmailAnalyzer:
 
         Return ONLY the JSON object.
         """
-        
-        calendar_response = self.model.generate_content(calendar_prompt)
-        tasks_response = self.model.generate_content(tasks_prompt)
-        
-        # Parse calendar meetings with better error handling
-        calendar_data = self._parse_response(calendar_response)
-        if isinstance(calendar_data, dict) and 'meetings' in calendar_data:
-            analysis_results['calendar_meetings'] = calendar_data['meetings']
-        else:
-            analysis_results['calendar_meetings'] = []
 
-        # Parse tasks with better error handling
-        tasks_data = self._parse_response(tasks_response)
-        if isinstance(tasks_data, dict) and 'tasks' in tasks_data:
-            analysis_results['notion_tasks'] = tasks_data['tasks']
-        else:
-            analysis_results['notion_tasks'] = []
-        
-        return analysis_results
-    
+    def _combined_prompt(self):
+        """Prompt that returns the analysis, meetings and tasks as one JSON object."""
+        return f"""
+        Analyze this email comprehensively and return ONLY a JSON object with the following structure:
+
+        Remember this carefully !!
+        If the mail mentions anything about a meeting then include it in the calendar segment and exclude it from the tasks segment.
+
+        {{
+            "nlp_analysis": {{
+                "key_topics": [],
+                "named_entities": {{
+                    "people": [],
+                    "organizations": [],
+                    "locations": []
+                }},
+                "tone": "",
+                "action_items": [],
+                "important_dates": []
+            }},
+            "priority_analysis": {{
+                "priority_score": 0,
+                "priority_reasons": []
+            }},
+            "content_segments": {{
+                "tasks": [],
+                "calendar": [],
+                "others": []
+            }},
+            "spam_analysis": {{
+                "spam_score": 0,
+                "spam_reasons": []
+            }},
+            "authority_analysis": {{
+                "is_internal": false,
+                "authority_level": "",
+                "priority_multiplier": 1.0,
+                "red_flags": []
+            }},
+            "calendar_meetings": [],
+            "notion_tasks": []
+        }}
+
+        "calendar_meetings" lists every calendar meeting in the email (an empty array if there are none).
+        "notion_tasks" lists every task, each with:
+        - name: task description
+        - due_date: deadline if specified (optional)
+
+        Fill in the above structure based on analyzing this email content: {self.email_content}
+        For the sender email: {self.sender_email}
+
+        Important: Return ONLY the JSON object with no additional text, markdown formatting, or explanation.
+        """
+
     def _parse_response(self, response):
         """Parse the response from the model and handle errors."""
         try:
@@ -158,12 +269,15 @@ def analyze_email():
         data = request.get_json()
         email_content = data.get('email_content')
         sender_email = data.get('sender_email', '')
+        mode = data.get('mode') or request.args.get('mode')
+        if mode not in (None, 'parallel', 'single'):
+            return jsonify({'error': "mode must be 'parallel' or 'single'"}), 400
         
         if not email_content:
             return jsonify({'error': 'No email content provided'}), 400
             
         analyzer = EmailAnalyzer(email_content, sender_email)
-        analysis_results = analyzer.analyze_email()
+        analysis_results = analyzer.analyze_email(mode)
             
         # Calculate final priority score
         if 'priority_analysis' in analysis_results and 'authority_analysis' in analysis_results: